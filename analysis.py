@@ -0,0 +1,69 @@
+# -*- coding: utf-8 -*-
+
+"""
+Contains the AnalysisPool class, a pool of threads that turn what a session
+captured at a breakpoint into report entries, so that the debugged script
+doesn't have to wait for it.
+"""
+
+import logging
+import Queue
+import threading
+
+
+class AnalysisPool(object):
+    """
+    Worker threads that run analysis jobs.
+
+    Jobs from one session may finish in any order; Session puts its events
+    back in order before writing them.
+    """
+
+    # Queue of (func, args) jobs; None stops a worker
+    # @type Queue.Queue
+    queue = None
+
+    # @type list[threading.Thread]
+    threads = None
+
+    def __init__(self, workers, maxsize=1024):
+        """
+        @param workers: The number of worker threads.
+        @param maxsize: How many jobs may be queued before sessions block.
+        """
+        self.queue = Queue.Queue(maxsize)
+        self.threads = []
+        for i in range(workers):
+            thread = threading.Thread(target=self.run,
+                                      name="analysis-%d" % i)
+            thread.daemon = True
+            thread.start()
+            self.threads.append(thread)
+
+    def submit(self, func, *args):
+        """
+        Queues a call to func(*args) on one of the workers.
+
+        @param func: The function to call.
+        """
+        self.queue.put((func, args))
+
+    def run(self):
+        """Runs jobs until stop() is called."""
+        while True:
+            job = self.queue.get()
+            if job is None:
+                return
+
+            (func, args) = job
+            try:
+                func(*args)
+            except Exception:
+                logging.exception("Analysis failed")
+
+    def stop(self):
+        """Runs the jobs that are still queued, then stops the workers."""
+        for _ in self.threads:
+            self.queue.put(None)
+        for thread in self.threads:
+            thread.join()
@@ -0,0 +1,11 @@
+# -*- coding: utf-8 -*-
+
+"""
+Benchmarks for iodog. Run them from the top-level directory, e.g.:
+
+    python2 -m bench.responses
+    python2 -m bench.throughput
+
+bench.engine holds the simulated PHP requests that bench.throughput runs
+against iodog; it can also be pointed at a running iodog by hand.
+"""
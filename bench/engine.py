@@ -0,0 +1,328 @@
+# -*- coding: utf-8 -*-
+
+"""
+A stand-in for PHP with XDebug: a DBGp engine that connects to iodog and
+plays back a synthetic workload, so that iodog can be run and measured
+without a PHP stack.
+
+The engine answers the commands iodog uses (status, run, breakpoint_set,
+breakpoint_get, breakpoint_update, breakpoint_remove, feature_set, stack_get,
+eval and detach) and times how long iodog keeps it waiting. To run a single
+session against an iodog that is already listening:
+
+    python2 -m bench.engine --port 9000 --calls 1000 --hit-rate 0.2
+"""
+
+import argparse
+import base64
+import random
+import socket
+import time
+
+
+NS = ('xmlns="urn:debugger_protocol_v1" '
+      'xmlns:xdebug="https://xdebug.org/dbgp/xdebug"')
+
+# Functions that the shipped rulesets watch, and some that none do
+WATCHED = ['fopen', 'file_exists', 'file_put_contents', 'mysql_query',
+           'mysqli_query', 'exec', 'fsockopen', 'unlink']
+UNWATCHED = ['strlen', 'str_replace', 'array_map', 'count', 'sprintf']
+
+
+class Workload(object):
+    """What a simulated PHP request does."""
+
+    def __init__(self, calls=1000, hit_rate=0.2, depth=5, arg_size=16,
+                 seed=None):
+        """
+        @param calls: How many function calls the request makes.
+        @param hit_rate: The fraction of calls that go to watched functions.
+        @param depth: The depth of the stack at every call.
+        @param arg_size: The length of each call's first argument.
+        @param seed: Seed for picking the calls; None for a random one.
+        """
+        self.calls = calls
+        self.hit_rate = hit_rate
+        self.depth = depth
+        self.arg_size = arg_size
+        self.seed = seed
+
+    def call_list(self):
+        """Returns the list of functions the request calls, in order."""
+        rnd = random.Random(self.seed)
+        return [rnd.choice(WATCHED if rnd.random() < self.hit_rate
+                           else UNWATCHED)
+                for _ in range(self.calls)]
+
+
+class Stats(object):
+    """Timings of a single session, in seconds."""
+
+    def __init__(self):
+        # From connecting until iodog first lets the script run
+        self.setup = None
+
+        # For every break, how long iodog kept the script paused
+        self.pauses = []
+
+        # From connecting until the session ended
+        self.total = None
+
+        # Commands received, by name
+        self.commands = dict()
+
+
+class Engine(object):
+    """A DBGp engine running one Workload over one connection."""
+
+    # Number of distinct call sites per function
+    SITES = 4
+
+    def __init__(self, address, workload, pid=4242, family=socket.AF_INET,
+                 fileuri="file:///srv/http/index.php"):
+        """
+        @param address: Where iodog listens, as for socket.connect.
+        @param workload: The Workload to play back.
+        @param pid: The process ID to report.
+        @param family: The address family of the socket.
+        @param fileuri: The script to pretend to run.
+        """
+        self.address = address
+        self.workload = workload
+        self.calls = workload.call_list()
+        self.pid = pid
+        self.family = family
+        self.fileuri = fileuri
+        self.stats = Stats()
+
+        self.sock = None
+        self.buf = b''
+        self.pos = 0
+        self.state = 'starting'
+        self.current = None
+        self.features = dict()
+
+        # Breakpoints by function name and by id
+        self.bps = dict()
+        self.byid = dict()
+        self.nextid = 1000
+
+        self.value = ('/srv/http/' * workload.arg_size)[:workload.arg_size]
+
+    def connect(self):
+        """Connects to iodog and sends the init packet."""
+        self.sock = socket.socket(self.family, socket.SOCK_STREAM)
+        self.sock.connect(self.address)
+        if self.family != getattr(socket, 'AF_UNIX', None):
+            self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.send('<?xml version="1.0" encoding="iso-8859-1"?>\n<init %s '
+                  'fileuri="%s" language="PHP" protocol_version="1.0" '
+                  'appid="%d" idekey="iodog-bench"><engine version="2.9">'
+                  '<![CDATA[Xdebug]]></engine></init>'
+                  % (NS, self.fileuri, self.pid))
+
+    def send(self, body):
+        self.sock.sendall(b'%d\0%s\0' % (len(body), body))
+
+    def recv_cmd(self):
+        """Returns the next command, or None if iodog hung up."""
+        while b'\0' not in self.buf:
+            data = self.sock.recv(65536)
+            if not data:
+                return None
+            self.buf += data
+        (cmd, self.buf) = self.buf.split(b'\0', 1)
+        return cmd
+
+    def run(self):
+        """Plays back the workload. Returns the session's Stats."""
+        start = time.time()
+        paused = None
+        self.connect()
+
+        while self.state != 'stopped':
+            line = self.recv_cmd()
+            if line is None:
+                break
+
+            name = line.split(' ', 1)[0]
+            self.stats.commands[name] = self.stats.commands.get(name, 0) + 1
+
+            if name == 'run':
+                now = time.time()
+                if self.stats.setup is None:
+                    self.stats.setup = now - start
+                elif paused is not None:
+                    self.stats.pauses.append(now - paused)
+                paused = None
+
+            self.send(self.handle(line))
+            if name == 'run' and self.state == 'break':
+                paused = time.time()
+
+        self.sock.close()
+        self.stats.total = time.time() - start
+        return self.stats
+
+    def advance(self):
+        """Runs the script up to the next breakpoint or its end."""
+        while self.pos < len(self.calls):
+            call = self.calls[self.pos]
+            self.pos += 1
+
+            bp = self.bps.get(call)
+            if bp is None or bp['state'] != 'enabled':
+                continue
+
+            bp['hit_count'] += 1
+            (value, condition, count) = (bp['hit_value'],
+                                         bp['hit_condition'], bp['hit_count'])
+            if value and ((condition == '>=' and count < value) or
+                          (condition == '==' and count != value) or
+                          (condition == '%' and count % value)):
+                continue
+
+            self.current = call
+            return 'break'
+
+        self.current = None
+        return 'stopping'
+
+    def response(self, cmd, tid, attrs='', body=''):
+        return ('<?xml version="1.0" encoding="iso-8859-1"?>\n<response %s '
+                'command="%s" transaction_id="%s"%s>%s</response>'
+                % (NS, cmd, tid, attrs, body))
+
+    def handle(self, line):
+        """Returns the response to a command."""
+        parts = line.split(' ')
+        cmd = parts[0]
+        opts = dict()
+        i = 1
+        while i < len(parts) - 1 and parts[i] != '--':
+            opts[parts[i]] = parts[i + 1]
+            i += 2
+        tid = opts.get('-i')
+
+        if cmd in ('status', 'run'):
+            if cmd == 'run':
+                self.state = self.advance()
+            return self.response(cmd, tid, ' status="%s" reason="ok"'
+                                 % self.state)
+
+        if cmd == 'breakpoint_set':
+            self.nextid += 1
+            bp = dict(id=self.nextid, function=opts.get('-m'), hit_count=0,
+                      hit_value=0, hit_condition='>=', state='enabled')
+            self.bps[bp['function']] = self.byid[bp['id']] = bp
+            return self.response(cmd, tid, ' id="%d"' % bp['id'])
+
+        if cmd in ('breakpoint_get', 'breakpoint_update',
+                   'breakpoint_remove'):
+            bp = self.byid.get(int(opts.get('-d', 0)))
+            if bp is None:
+                return self.error(cmd, tid, 205, "no such breakpoint")
+            if cmd == 'breakpoint_remove':
+                del self.byid[bp['id']]
+                del self.bps[bp['function']]
+            elif cmd == 'breakpoint_update':
+                bp['hit_value'] = int(opts.get('-h', bp['hit_value']))
+                bp['hit_condition'] = opts.get('-o', bp['hit_condition'])
+                bp['state'] = opts.get('-s', bp['state'])
+            return self.response(cmd, tid, '', '<breakpoint type="call" '
+                                 'function="%s" state="%s" hit_count="%d" '
+                                 'hit_value="%d" id="%d"></breakpoint>'
+                                 % (bp['function'], bp['state'],
+                                    bp['hit_count'], bp['hit_value'],
+                                    bp['id']))
+
+        if cmd == 'feature_set':
+            self.features[opts.get('-n')] = opts.get('-v')
+            return self.response(cmd, tid, ' feature="%s" success="1"'
+                                 % opts.get('-n'))
+
+        if cmd == 'stack_get':
+            frames = ['<stack where="%s" level="0" type="file" '
+                      'filename="file:///srv/http/wp-includes/load.php" '
+                      'lineno="%d"></stack>'
+                      % (self.current, 100 + self.pos % self.SITES)]
+            for level in range(1, self.workload.depth):
+                frames.append('<stack where="fn%d" level="%d" type="file" '
+                              'filename="file:///srv/http/lib%d.php" '
+                              'lineno="%d"></stack>'
+                              % (level, level, level, level * 7))
+            return self.response(cmd, tid, '', ''.join(frames))
+
+        if cmd == 'eval':
+            # Like XDebug, send at most max_data bytes of the value
+            max_data = int(self.features.get('max_data') or 0)
+            value = self.value[:max_data] if max_data else self.value
+            return self.response(cmd, tid, '', '<property type="array" '
+                                 'children="1" numchildren="2" page="0" '
+                                 'pagesize="32"><property name="0" '
+                                 'type="string" size="%d" encoding="base64">'
+                                 '<![CDATA[%s]]></property><property '
+                                 'name="1" type="int"><![CDATA[1]]>'
+                                 '</property></property>'
+                                 % (len(self.value), base64.b64encode(value)))
+
+        if cmd == 'detach':
+            self.state = 'stopped'
+            return self.response(cmd, tid, ' status="stopping" reason="ok"')
+
+        return self.error(cmd, tid, 4, "unimplemented command")
+
+    def error(self, cmd, tid, code, message):
+        return self.response(cmd, tid, '', '<error code="%d"><message>'
+                             '<![CDATA[%s]]></message></error>'
+                             % (code, message))
+
+
+def add_workload_args(parser):
+    """Adds options describing a Workload to an ArgumentParser."""
+    parser.add_argument("--calls", type=int, default=1000,
+                        help="function calls per request (default: 1000)")
+    parser.add_argument("--hit-rate", type=float, default=0.2,
+                        help="fraction of calls to watched functions "
+                             "(default: 0.2)")
+    parser.add_argument("--depth", type=int, default=5,
+                        help="stack depth (default: 5)")
+    parser.add_argument("--arg-size", type=int, default=16,
+                        help="length of the first argument (default: 16)")
+    parser.add_argument("--seed", type=int, default=None,
+                        help="seed for the choice of calls")
+
+
+def workload_from_args(args):
+    return Workload(args.calls, args.hit_rate, args.depth, args.arg_size,
+                    args.seed)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Run one simulated PHP request against iodog.")
+    parser.add_argument("--host", default="127.0.0.1",
+                        help="where iodog listens (default: 127.0.0.1)")
+    parser.add_argument("--port", type=int, default=9000,
+                        help="iodog's port (default: 9000)")
+    parser.add_argument("--socket", metavar="PATH",
+                        help="connect to iodog's Unix domain socket instead")
+    parser.add_argument("--pid", type=int, default=4242,
+                        help="process ID to report (default: 4242)")
+    add_workload_args(parser)
+    args = parser.parse_args()
+
+    if args.socket:
+        engine = Engine(args.socket, workload_from_args(args), args.pid,
+                        socket.AF_UNIX)
+    else:
+        engine = Engine((args.host, args.port), workload_from_args(args),
+                        args.pid)
+    stats = engine.run()
+    print("setup %.2f ms, %d breaks, total %.3f s" % (
+        stats.setup * 1000 if stats.setup is not None else 0,
+        len(stats.pauses), stats.total))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,56 @@
+# -*- coding: utf-8 -*-
+
+"""
+Micro-benchmark for reading the status and breakpoint id out of the most
+common debugger responses, comparing the attribute scanner in
+dbgp.Response.get_attr with a full ElementTree parse.
+"""
+
+import timeit
+import xml.etree.ElementTree as ElementTree
+
+import dbgp
+
+
+HEAD = ('<?xml version="1.0" encoding="iso-8859-1"?>\n<response '
+        'xmlns="urn:debugger_protocol_v1" '
+        'xmlns:xdebug="https://xdebug.org/dbgp/xdebug" ')
+
+RESPONSES = [
+    ('status', dbgp.StatusResponse, 'status',
+     HEAD + 'command="status" transaction_id="7" status="starting" '
+     'reason="ok"></response>'),
+    ('run', dbgp.StatusResponse, 'status',
+     HEAD + 'command="run" transaction_id="8" status="break" reason="ok">'
+     '<xdebug:message filename="file:///srv/http/wp/wp-includes/load.php" '
+     'lineno="128"></xdebug:message></response>'),
+    ('breakpoint_set', dbgp.BreakpointSetResponse, 'id',
+     HEAD + 'command="breakpoint_set" transaction_id="9" '
+     'id="38490001"></response>'),
+]
+
+
+def rate(func, number):
+    """Returns how many times per second func can be called."""
+    best = min(timeit.repeat(func, number=number, repeat=3))
+    return number / best
+
+
+def main(number=20000):
+    print("%-16s %14s %14s %8s" % ("response", "ElementTree/s", "scanner/s",
+                                   "speedup"))
+
+    for (name, res_cls, attr, msg) in RESPONSES:
+        def parse():
+            ElementTree.fromstring(msg).get(attr)
+
+        def scan():
+            res_cls(msg, name, '', None).get_attr(attr)
+
+        slow = rate(parse, number)
+        fast = rate(scan, number)
+        print("%-16s %14d %14d %7.1fx" % (name, slow, fast, fast / slow))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,157 @@
+# -*- coding: utf-8 -*-
+
+"""
+End-to-end benchmark: starts iodog in a scratch directory, runs a number of
+simulated PHP requests (see bench.engine) against it and reports:
+
+    events/s   breaks handled per second, over all sessions
+    setup      per session, from connecting until iodog first lets the
+               script run (registering breakpoints, opening the report)
+    pause      per break, how long iodog keeps the script waiting
+
+For example:
+
+    python2 -m bench.throughput --sessions 20 --concurrency 4
+    python2 -m bench.throughput --iodog-args="--stack-table --compress gzip"
+
+Engines run in their own processes, so they don't compete with each other
+for the interpreter lock.
+"""
+
+import argparse
+import multiprocessing
+import os
+import shlex
+import shutil
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+from bench.engine import Engine, add_workload_args, workload_from_args
+
+
+IODOG = os.path.join(os.path.dirname(os.path.dirname(
+    os.path.abspath(__file__))), "iodog")
+
+
+def free_port():
+    """Returns a TCP port that is free right now."""
+    sock = socket.socket()
+    sock.bind(("127.0.0.1", 0))
+    port = sock.getsockname()[1]
+    sock.close()
+    return port
+
+
+def wait_for(address, family, timeout=10.0):
+    """Waits until something listens on the given address."""
+    deadline = time.time() + timeout
+    while True:
+        sock = socket.socket(family, socket.SOCK_STREAM)
+        try:
+            sock.connect(address)
+            return
+        except socket.error:
+            if time.time() > deadline:
+                raise
+            time.sleep(0.05)
+        finally:
+            sock.close()
+
+
+def run_session(job):
+    """Runs one session; called in a worker process."""
+    (address, family, workload, pid) = job
+    stats = Engine(address, workload, pid, family).run()
+    return (stats.setup, stats.pauses, stats.total)
+
+
+def percentile(values, fraction):
+    """Returns the given percentile of a list of numbers."""
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(int(len(values) * fraction), len(values) - 1)]
+
+
+def report(name, values):
+    """Prints a summary of a list of durations, in milliseconds."""
+    values = [v * 1000 for v in values if v is not None]
+    print("%-10s mean %8.3f  p50 %8.3f  p95 %8.3f  p99 %8.3f  max %8.3f ms"
+          % (name, sum(values) / max(len(values), 1),
+             percentile(values, 0.5), percentile(values, 0.95),
+             percentile(values, 0.99), max(values or [0])))
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Measure iodog's throughput and the latency it adds.")
+    parser.add_argument("--sessions", type=int, default=20,
+                        help="requests to simulate (default: 20)")
+    parser.add_argument("--concurrency", type=int, default=1,
+                        help="requests to run at once (default: 1)")
+    parser.add_argument("--iodog-args", default="",
+                        help="extra options for iodog, as one string")
+    parser.add_argument("--unix", action="store_true",
+                        help="connect over a Unix domain socket, not TCP")
+    parser.add_argument("--keep", action="store_true",
+                        help="keep the scratch directory with the reports")
+    add_workload_args(parser)
+    args = parser.parse_args()
+
+    workload = workload_from_args(args)
+    workdir = tempfile.mkdtemp(prefix="iodog-bench-")
+    if args.unix:
+        (address, family) = (os.path.join(workdir, "iodog.sock"),
+                             socket.AF_UNIX)
+        listen = ["--socket", address]
+    else:
+        port = free_port()
+        (address, family) = (("127.0.0.1", port), socket.AF_INET)
+        listen = ["--host", "127.0.0.1", "--port", str(port)]
+
+    with open(os.devnull, "w") as devnull:
+        iodog = subprocess.Popen([sys.executable, IODOG] + listen +
+                                 shlex.split(args.iodog_args),
+                                 cwd=workdir, stdout=devnull, stderr=devnull)
+    try:
+        wait_for(address, family)
+        pool = multiprocessing.Pool(args.concurrency)
+        jobs = [(address, family, workload, 10000 + i)
+                for i in range(args.sessions)]
+
+        start = time.time()
+        results = pool.map(run_session, jobs, chunksize=1)
+        elapsed = time.time() - start
+        pool.close()
+        pool.join()
+    finally:
+        iodog.send_signal(signal.SIGINT)
+        for _ in range(50):
+            if iodog.poll() is not None:
+                break
+            time.sleep(0.1)
+        else:
+            iodog.kill()
+            iodog.wait()
+
+        if args.keep:
+            print("Reports are in %s" % workdir)
+        else:
+            shutil.rmtree(workdir)
+
+    events = sum(len(pauses) for (setup, pauses, total) in results)
+    print("%d sessions of %d calls (hit rate %.2f), concurrency %d"
+          % (args.sessions, args.calls, args.hit_rate, args.concurrency))
+    print("%d events in %.3f s: %.0f events/s"
+          % (events, elapsed, events / elapsed))
+    report("setup", [setup for (setup, pauses, total) in results])
+    report("pause", [p for (setup, pauses, total) in results for p in pauses])
+    report("session", [total for (setup, pauses, total) in results])
+
+
+if __name__ == '__main__':
+    main()
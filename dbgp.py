@@ -27,19 +27,36 @@ the following conditions:
 """
 
 import xml.etree.ElementTree as ElementTree
+from xml.sax.saxutils import unescape
+import re
+import os
 import socket
+import stat
+import time
 import base64
 
+import transcript
+
+
+# Python 2 doesn't know the constant; this is its value on Linux
+SO_REUSEPORT = getattr(socket, 'SO_REUSEPORT', 15)
+
 
 class Response:
     """Contains response data from a command made to the debugger."""
     ns = '{urn:debugger_protocol_v1}'
 
+    # The root <response> start tag, if all of its attribute values are
+    # plain (no entities to decode)
+    ROOT = re.compile(r'<response((?:\s+[\w:]+="[^"<&]*")*)\s*/?>')
+    ATTR = re.compile(r'([\w:]+)="([^"]*)"')
+
     def __init__(self, response, cmd, cmd_args, api):
         self.response = response
         self.cmd = cmd
         self.cmd_args = cmd_args
         self.xml = None
+        self.attrs = False
         self.api = api
         if "<error" in self.response:
             self.__parse_error()
@@ -93,6 +110,36 @@ class Response:
             self.__determine_ns()
         return self.xml
 
+    def get_attr(self, name):
+        """Get an attribute of the root element.
+
+        Most responses are a single <response> element that is only
+        consulted for one attribute, so the start tag is scanned directly
+        instead of building a tree. Anything unexpected, such as another
+        namespace or escaped characters, falls back to as_xml().
+
+        @param name: the attribute name, e.g. 'status'
+        """
+        attrs = self.__scan_root()
+        if attrs is None:
+            return self.as_xml().get(name)
+        return attrs.get(name)
+
+    def __scan_root(self):
+        """Scan the attributes of the root element, or return None if the
+        response doesn't look as expected."""
+        if self.attrs is False:
+            self.attrs = None
+            match = self.ROOT.search(self.response)
+            if match is not None:
+                head = self.response[:match.start()]
+                decl = 1 if head.lstrip().startswith('<?xml') else 0
+                attrs = dict(self.ATTR.findall(match.group(1)))
+                if head.count('<') == decl \
+                        and attrs.get('xmlns') == self.ns[1:-1]:
+                    self.attrs = attrs
+        return self.attrs
+
     def __determine_ns(self):
         tag_repr = str(self.xml.tag)
         if tag_repr[0] != '{':
@@ -118,7 +165,7 @@ class StatusResponse(Response):
     """Response object returned by the status command."""
 
     def __str__(self):
-        return self.as_xml().get('status')
+        return self.get_attr('status')
 
     is_starting = lambda self: str(self) == "starting"
     is_stopping = lambda self: str(self) == "stopping"
@@ -130,9 +177,70 @@ class StatusResponse(Response):
 class StackGetResponse(Response):
     """Response object used by the stack_get command."""
 
+    TOP = re.compile(r'<stack\s([^>]*)>')
+    ATTR = re.compile(r'([\w:]+)="([^"]*)"')
+    ENTITIES = {'&quot;': '"', '&apos;': "'"}
+
+    # Raw <stack> elements, see __raw_frames
+    frames = False
+
     def get_stack(self):
         return list(self.as_xml())
 
+    def get_stack_xml(self):
+        """Get the stack frames as a string of namespace-free <stack>
+        elements.
+
+        When the response has the usual shape, the frames are sliced
+        straight out of the raw response without parsing it. Otherwise
+        they are parsed and serialized again.
+        """
+        frames = self.__raw_frames()
+        if frames is not None:
+            return frames
+
+        sx = ''.join([ElementTree.tostring(x) for x in self.get_stack()])
+
+        # Smash the XML namespaces
+        return sx.replace('ns0:stack xmlns:ns0="urn:debugger_protocol_v1"',
+                          'stack')
+
+    def get_top(self):
+        """Get the attributes of the innermost stack frame as a dict, e.g.
+        where, filename and lineno. Empty if there are no frames."""
+        frames = self.__raw_frames()
+        if frames is not None:
+            match = self.TOP.match(frames)
+            if match is not None:
+                return dict([(k, unescape(v, self.ENTITIES)) for (k, v)
+                             in self.ATTR.findall(match.group(1))])
+
+        for frame in self.get_stack():
+            return dict(frame.attrib)
+        return dict()
+
+    def get_where(self):
+        """Get the function name of the innermost stack frame, if any."""
+        return self.get_top().get('where')
+
+    def __raw_frames(self):
+        """Slice the <stack> elements out of the raw response, or return None
+        if the response contains anything else."""
+        if self.frames is not False:
+            return self.frames
+
+        msg = self.response
+        start = msg.find('<stack ')
+        end = msg.rfind('</response>')
+        self.frames = None
+        if start != -1 and end > start:
+            frames = msg[start:end]
+            tags = frames.count('<')
+            if tags == frames.count('<stack ') + frames.count('</stack>') \
+                    and 'xmlns' not in frames:
+                self.frames = frames
+        return self.frames
+
 
 class ContextGetResponse(Response):
     """Response object used by the context_get command.
@@ -144,12 +252,21 @@ class ContextGetResponse(Response):
         Response.__init__(self, response, cmd, cmd_args, api)
         self.properties = []
 
+    def get_properties(self):
+        """Returns the top-level properties. Their children are only
+        created when they are looked at."""
+        return [self._create_property(c) for c in self.as_xml()]
+
     def get_context(self):
-        for c in list(self.as_xml()):
-            self.create_properties(ContextProperty(c))
+        """Returns every property, children included, as a flat list."""
+        for p in self.get_properties():
+            self.create_properties(p)
 
         return self.properties
 
+    def _create_property(self, node):
+        return ContextProperty(node)
+
     def create_properties(self, property):
         self.properties.append(property)
         for p in property.children:
@@ -168,12 +285,8 @@ class EvalResponse(ContextGetResponse):
             else:
                 raise e
 
-    def get_context(self):
-        code = self.get_code()
-        for c in list(self.as_xml()):
-            self.create_properties(EvalProperty(c, code, self.api.language))
-
-        return self.properties
+    def _create_property(self, node):
+        return EvalProperty(node, self.get_code(), self.api.language)
 
     def get_code(self):
         cmd = self.get_cmd_args()
@@ -185,10 +298,21 @@ class BreakpointSetResponse(Response):
     """Response object returned by the breakpoint_set command."""
 
     def get_id(self):
-        return int(self.as_xml().get('id'))
+        return int(self.get_attr('id'))
 
     def __str__(self):
-        return self.as_xml().get('id')
+        return self.get_attr('id')
+
+
+class BreakpointGetResponse(Response):
+    """Response object returned by the breakpoint_get command."""
+
+    def get_hit_count(self):
+        """How many times the breakpoint was hit, or None if unknown."""
+        bp = self.as_xml().find('%sbreakpoint' % self.ns)
+        if bp is None or bp.get('hit_count') is None:
+            return None
+        return int(bp.get('hit_count'))
 
 
 class FeatureGetResponse(Response):
@@ -217,7 +341,16 @@ class Api:
     conn = None
     transID = 0
 
-    def __init__(self, connection):
+    # Where command round trip times are recorded, if anywhere
+    # @type metrics.Metrics
+    metrics = None
+
+    # Maximum number of commands send_cmds() writes before reading replies
+    PIPELINE_DEPTH = 256
+
+    TRANSACTION_ID = re.compile(r'\stransaction_id="(\d+)"')
+
+    def __init__(self, connection, metrics=None):
         """Create a new Api using a Connection object.
 
         The Connection object specifies the debugger connection,
@@ -225,7 +358,9 @@ class Api:
         with it.
 
         connection: The Connection object to use
+        metrics: A metrics.Metrics to record command timings in, if any
         """
+        self.metrics = metrics
         self.language = None
         self.protocol = None
         self.idekey = None
@@ -252,6 +387,16 @@ class Api:
         self.startfile = xml.get("fileuri")
         self.appid = xml.get("appid")
 
+    def __build_cmd(self, cmd, args):
+        """Build a command string with a fresh transaction ID."""
+        args = args.strip()
+        send = cmd.strip()
+        self.transID += 1
+        send += ' -i ' + str(self.transID)
+        if len(args) > 0:
+            send += ' ' + args
+        return send, args
+
     def send_cmd(self, cmd, args='', res_cls=Response):
         """Send a command to the debugger.
 
@@ -265,16 +410,66 @@ class Api:
         @param args: arguments for the command, if any
         @param res_cls: class of the expected response
         """
-        args = args.strip()
-        send = cmd.strip()
-        self.transID += 1
-        send += ' -i ' + str(self.transID)
-        if len(args) > 0:
-            send += ' ' + args
+        send, args = self.__build_cmd(cmd, args)
+        start = time.time()
         self.conn.send_msg(send)
         msg = self.conn.recv_msg()
+        if self.metrics is not None:
+            self.metrics.observe('iodog_dbgp_command_seconds', cmd,
+                                 time.time() - start)
         return res_cls(msg, cmd, args, self)
 
+    def send_cmds(self, cmds):
+        """Send a batch of commands to the debugger without waiting for each
+        reply in between.
+
+        The commands are written in chunks of PIPELINE_DEPTH, each chunk in a
+        single write, after which the replies are read back and matched to
+        their commands by transaction ID.
+
+        Returns a list of Response objects, in the same order as cmds.
+
+        @param cmds: list of (cmd, args, res_cls) tuples, as for send_cmd
+        """
+        depth = self.PIPELINE_DEPTH
+        responses = []
+        for i in range(0, len(cmds), depth):
+            responses.extend(self.__send_chunk(cmds[i:i + depth]))
+        return responses
+
+    def __send_chunk(self, cmds):
+        """Send one chunk of a send_cmds() batch and read its replies."""
+        pending = {}
+        sends = []
+        for (cmd, args, res_cls) in cmds:
+            send, args = self.__build_cmd(cmd, args)
+            pending[self.transID] = (len(sends), cmd, args, res_cls)
+            sends.append(send)
+        start = time.time()
+        self.conn.send_msgs(sends)
+
+        # Read every reply before building any Response, so that an error
+        # response can't leave the rest of the batch unread on the socket.
+        msgs = [None] * len(sends)
+        for _ in sends:
+            msg = self.conn.recv_msg()
+            match = self.TRANSACTION_ID.search(msg)
+            if match is None or int(match.group(1)) not in pending:
+                raise ResponseError(
+                    "Unexpected transaction ID in response",
+                    msg)
+            msgs[pending[int(match.group(1))][0]] = msg
+
+        if self.metrics is not None:
+            # The whole chunk counts as a single round trip
+            names = set(cmd for (cmd, args, res_cls) in cmds)
+            self.metrics.observe('iodog_dbgp_command_seconds',
+                                 names.pop() if len(names) == 1 else 'batch',
+                                 time.time() - start)
+
+        return [res_cls(msgs[i], cmd, args, self)
+                for (i, cmd, args, res_cls) in sorted(pending.values())]
+
     def status(self):
         """Get the debugger status.
 
@@ -310,6 +505,18 @@ class Api:
             'feature_set',
             '-n ' + str(name) + ' -v ' + str(value))
 
+    def feature_set_many(self, features):
+        """Set several debugger features in a single round trip.
+
+        Returns a list of Response objects, in the order of
+        sorted(features).
+
+        @param features: dict of feature name -> new value
+        """
+        return self.send_cmds([
+            ('feature_set', '-n %s -v %s' % (name, features[name]), Response)
+            for name in sorted(features)])
+
     def run(self):
         """Tell the debugger to start or resume
         execution."""
@@ -429,6 +636,45 @@ class Api:
 
         return self.send_cmd('breakpoint_set', args, BreakpointSetResponse)
 
+    def breakpoint_set_calls(self, calls):
+        """
+        Set a call breakpoint on each of the given functions, sending the
+        whole batch at once instead of waiting for each reply in turn.
+
+        Returns a list of BreakpointSetResponse objects, in the order of
+        calls.
+
+        @param calls: Names of the functions to break on when entering.
+        """
+        return self.send_cmds([('breakpoint_set', '-t call -m %s' % call,
+                                BreakpointSetResponse) for call in calls])
+
+    def breakpoint_get(self, id):
+        """Get information about a breakpoint, such as its hit count.
+
+        @param id: The breakpoint ID.
+        """
+        return self.send_cmd('breakpoint_get', '-d %i' % id,
+                             BreakpointGetResponse)
+
+    def breakpoint_update(self, id, state=None, hit_value=None,
+                          hit_condition=None):
+        """Change a breakpoint.
+
+        @param id: The breakpoint ID.
+        @param state: 'enabled' or 'disabled'.
+        @param hit_value: Hit count the hit condition compares with.
+        @param hit_condition: One of '>=', '==' or '%'.
+        """
+        args = '-d %i' % id
+        if state is not None:
+            args += ' -s %s' % state
+        if hit_value is not None:
+            args += ' -h %i' % hit_value
+        if hit_condition is not None:
+            args += ' -o %s' % hit_condition
+        return self.send_cmd('breakpoint_update', args, Response)
+
     def breakpoint_list(self):
         """
         Request a list of breakpoints.
@@ -441,6 +687,165 @@ class Api:
         The ID is that returned in the response from breakpoint_set."""
         return self.send_cmd('breakpoint_remove', '-d %i' % id, Response)
 
+
+class Listener:
+    """Persistent listening socket that debugger engines connect to.
+
+    Unlike Connection.open(), which accepts a single debugger and then stops
+    listening, a Listener stays bound for its whole lifetime and hands out a
+    new Connection for every engine that connects.
+    """
+
+    serv = None
+
+    def __init__(self, host='', port=9000, backlog=128, reuse_port=False):
+        """Create a new Listener.
+
+        The socket is not bound until open() is called.
+
+        @param host: host name or address to listen on
+        @param port: port number to listen on
+        @param backlog: number of pending connections the kernel may queue
+        @param reuse_port: whether to set SO_REUSEPORT, so that several
+                           processes can listen on the same port and the
+                           kernel spreads connections across them
+        """
+        self.host = host
+        self.port = port
+        self.backlog = backlog
+        self.reuse_port = reuse_port
+
+    def open(self):
+        """Bind and start listening, unless already listening."""
+        if self.serv is not None:
+            return
+        serv = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        try:
+            serv.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            if self.reuse_port:
+                serv.setsockopt(socket.SOL_SOCKET, SO_REUSEPORT, 1)
+            serv.bind((self.host, self.port))
+            serv.listen(self.backlog)
+        except:
+            serv.close()
+            raise
+        self.serv = serv
+
+    def accept(self):
+        """Wait for a debugger engine to connect.
+
+        Returns a connected Connection object.
+        """
+        if self.serv is None:
+            self.open()
+        (sock, address) = self.serv.accept()
+        sock.settimeout(None)
+
+        # Commands are tiny and each one waits for a reply; don't let Nagle
+        # hold them back waiting for a delayed ACK.
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        return Connection(self.host, self.port, sock=sock, address=address)
+
+    def close(self):
+        """Stop listening."""
+        if self.serv is not None:
+            self.serv.close()
+            self.serv = None
+
+
+class UnixListener(Listener):
+    """Listener on a Unix domain socket, for debugger engines on the same
+    host (Xdebug 3 connects to client_host=unix:///path).
+
+    Messages are framed the same as over TCP, but skip the loopback TCP
+    stack. The socket file is replaced when it is stale, and removed again
+    by the process that created it.
+    """
+
+    # The process that created the socket file
+    owner = None
+
+    def __init__(self, path, mode=None, gid=None, backlog=128):
+        """Create a new UnixListener.
+
+        The socket is not bound until open() is called.
+
+        @param path: path of the socket file
+        @param mode: permissions of the socket file, e.g. 0660, or None to
+                     leave them to the umask
+        @param gid: group to give the socket file, or None to keep ours
+        @param backlog: number of pending connections the kernel may queue
+        """
+        Listener.__init__(self, path, 0, backlog)
+        self.path = path
+        self.mode = mode
+        self.gid = gid
+
+    def open(self):
+        """Bind and start listening, unless already listening."""
+        if self.serv is not None:
+            return
+        if self.is_stale():
+            os.unlink(self.path)
+
+        serv = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            serv.bind(self.path)
+            self.owner = os.getpid()
+            if self.mode is not None:
+                os.chmod(self.path, self.mode)
+            if self.gid is not None:
+                os.chown(self.path, -1, self.gid)
+            serv.listen(self.backlog)
+        except:
+            serv.close()
+            self.unlink()
+            raise
+        self.serv = serv
+
+    def is_stale(self):
+        """Whether the path is a socket file that nothing listens on."""
+        try:
+            if not stat.S_ISSOCK(os.stat(self.path).st_mode):
+                return False
+        except OSError:
+            return False
+
+        probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            probe.connect(self.path)
+        except socket.error:
+            return True
+        finally:
+            probe.close()
+        return False
+
+    def accept(self):
+        """Wait for a debugger engine to connect.
+
+        Returns a connected Connection object.
+        """
+        if self.serv is None:
+            self.open()
+        (sock, address) = self.serv.accept()
+        sock.settimeout(None)
+        return Connection(self.path, 0, sock=sock, address=(self.path, 0))
+
+    def close(self):
+        """Stop listening."""
+        Listener.close(self)
+        self.unlink()
+
+    def unlink(self):
+        """Remove the socket file, if this process created it."""
+        if self.owner == os.getpid():
+            self.owner = None
+            try:
+                os.unlink(self.path)
+            except OSError:
+                pass
+
+
 class Connection:
     """DBGP connection class, for managing the connection to the debugger.
 
@@ -451,21 +856,42 @@ class Connection:
     address = None
     isconned = 0
 
-    def __init__(self, host='', port=9000, timeout=30, input_stream=None):
+    # Records the messages passing through, if set
+    # @type transcript.TranscriptRecorder
+    recorder = None
+
+    # Size of the initial receive buffer, in bytes
+    RECV_SIZE = 65536
+
+    def __init__(self, host='', port=9000, timeout=30, input_stream=None,
+                 sock=None, address=None):
         """Create a new Connection.
 
-        The connection is not established until open() is called.
+        The connection is not established until open() is called, unless an
+        already connected socket is passed in (see Listener.accept()).
 
         @param host: host name where debugger is running
         @param port: port number which debugger is listening on
         @param timeout: time in seconds to wait for a debugger connection
         @param input_stream: object for checking input stream and interrupts
+        @param sock: an already connected socket, if any
+        @param address: the remote address of sock
         """
         self.port = port
         self.host = host
         self.timeout = timeout
         self.input_stream = input_stream
 
+        # Received but not yet parsed data lives in buf[start:end]
+        self.buf = bytearray(self.RECV_SIZE)
+        self.start = 0
+        self.end = 0
+
+        if sock is not None:
+            self.sock = sock
+            self.address = address
+            self.isconned = 1
+
     def __del__(self):
         """Make sure the connection is closed."""
         self.close()
@@ -484,6 +910,7 @@ class Connection:
             serv.listen(5)
             (self.sock, self.address) = serv.accept()
             self.sock.settimeout(None)
+            self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
         except socket.timeout:
             serv.close()
             raise DBGPTimeoutError("Timeout waiting for connection")
@@ -499,54 +926,68 @@ class Connection:
         if self.sock is not None:
             self.sock.close()
             self.sock = None
+        self.start = self.end = 0
         self.isconned = 0
 
-    def __recv_length(self):
-        """Get the length of the proceeding message."""
-        length = ''
-        while 1:
-            c = self.sock.recv(1)
-            if c == '':
-                self.close()
-                raise EOFError('Socket Closed')
-            if c == '\0':
-                return int(length)
-            if c.isdigit():
-                length = length + c
-
-    def __recv_null(self):
-        """Receive a null byte."""
-        while 1:
-            c = self.sock.recv(1)
-            if c == '':
-                self.close()
-                raise EOFError('Socket Closed')
-            if c == '\0':
-                return
+    def __fill(self, want):
+        """Receive data until at least `want` unparsed bytes are buffered.
 
-    def __recv_body(self, to_recv):
-        """Receive a message of a given length.
+        Data is received straight into the buffer. Unparsed bytes are moved
+        to the front when the buffer runs out of room, and the buffer grows
+        when a single message does not fit.
 
-        to_recv: length of the message to receive
+        @param want: number of unparsed bytes needed
         """
-        body = ''
-        while to_recv > 0:
-            buf = self.sock.recv(to_recv)
-            if buf == '':
+        buf = self.buf
+        while self.end - self.start < want:
+            if self.end == len(buf) or len(buf) - self.start < want:
+                pending = self.end - self.start
+                if self.start:
+                    buf[:pending] = buf[self.start:self.end]
+                    self.start, self.end = 0, pending
+                if len(buf) < want:
+                    buf.extend(bytearray(want - len(buf)))
+            n = self.sock.recv_into(memoryview(buf)[self.end:])
+            if n == 0:
                 self.close()
                 raise EOFError('Socket Closed')
-            to_recv -= len(buf)
-            body = body + buf
-        return body
+            self.end += n
 
     def recv_msg(self):
         """Receive a message from the debugger.
 
+        Messages are framed as the body length in ASCII digits, a null byte,
+        the body and another null byte.
+
         Returns a string, which is expected to be XML.
         """
-        length = self.__recv_length()
-        body = self.__recv_body(length)
-        self.__recv_null()
+        buf = self.buf
+        while True:
+            nul = buf.find(b'\0', self.start, self.end)
+            if nul != -1:
+                break
+            self.__fill(self.end - self.start + 1)
+
+        try:
+            length = int(memoryview(buf)[self.start:nul].tobytes())
+        except ValueError:
+            raise ResponseError("Invalid message length from debugger",
+                                buf[self.start:nul])
+
+        offset = nul + 1 - self.start
+        self.__fill(offset + length + 1)
+
+        begin = self.start + offset
+        body = memoryview(buf)[begin:begin + length].tobytes()
+        if buf[begin + length] != 0:
+            raise ResponseError("Message from debugger is not terminated",
+                                body)
+
+        self.start = begin + length + 1
+        if self.start == self.end:
+            self.start = self.end = 0
+        if self.recorder is not None:
+            self.recorder.record(transcript.RECEIVED, body)
         return body
 
     def send_msg(self, cmd):
@@ -554,60 +995,113 @@ class Connection:
 
         @param cmd: command to send
         """
-        self.sock.send(cmd + '\0')
+        if self.recorder is not None:
+            self.recorder.record(transcript.SENT, cmd)
+        self.sock.sendall(cmd + '\0')
+
+    def send_msgs(self, cmds):
+        """Send several messages to the debugger in a single write.
 
+        @param cmds: commands to send
+        """
+        if self.recorder is not None:
+            for cmd in cmds:
+                self.recorder.record(transcript.SENT, cmd)
+        self.sock.sendall(''.join([cmd + '\0' for cmd in cmds]))
+
+
+class ContextProperty(object):
+    """A property (variable) sent by the debugger.
+
+    Properties are built around their XML node and work everything out
+    only when asked: values are decoded on first access, and child
+    properties are created when the children are first looked at. Most
+    of a large value is never looked at, so most of it is never decoded.
+    """
+
+    __slots__ = ('node', 'parent', 'depth', 'is_last_child', '_value',
+                 '_children', '_display_name')
 
-class ContextProperty:
     ns = '{urn:debugger_protocol_v1}'
 
     def __init__(self, node, parent=None, depth=0):
+        self.node = node
         self.parent = parent
-        self.__determine_type(node)
-        self._determine_displayname(node)
-        self.encoding = node.get('encoding')
         self.depth = depth
-
-        self.size = node.get('size')
-        self.value = ""
-        self.type = ""
-        self.display_name = "?"
         self.is_last_child = False
-        self.num_crs = 0
+        self._value = None
+        self._children = None
+        self._display_name = None
+
+    @property
+    def type(self):
+        nodetype = self.node.get('classname')
+        if nodetype is None:
+            nodetype = self.node.get('type')
+        if nodetype is None:
+            nodetype = 'unknown'
+        return nodetype
+
+    @property
+    def encoding(self):
+        return self.node.get('encoding')
 
-        self._determine_children(node)
-        self.__determine_value(node)
-        self.__init_children(node)
+    @property
+    def size(self):
         if self.type == 'scalar':
-            self.size = len(self.value) - 2
+            return len(self.value) - 2
+        return self.node.get('size')
+
+    @property
+    def value(self):
+        if self._value is None:
+            self._value = self.__determine_value(self.node)
+        return self._value
+
+    @property
+    def num_crs(self):
+        return self.value.count('\n')
+
+    @property
+    def display_name(self):
+        if self._display_name is None:
+            self._display_name = self._determine_displayname(self.node)
+        return self._display_name
+
+    @property
+    def num_declared_children(self):
+        children = self.node.get('numchildren')
+        if children is None:
+            children = self.node.get('children')
+        if children is None:
+            return 0
+        return int(children)
+
+    @property
+    def has_children(self):
+        return self.num_declared_children > 0
+
+    @property
+    def children(self):
+        if self._children is None:
+            self._children = self.__init_children(self.node)
+        return self._children
 
     def __determine_value(self, node):
         if self.has_children:
-            self.value = ""
-            return
+            return ""
 
-        self.value = self._get_enc_node_text(node, 'value')
-        if self.value is None:
+        value = self._get_enc_node_text(node, 'value')
+        if value is None:
             if self.encoding == 'base64':
-                if node.text is None:
-                    self.value = ""
-                else:
-                    self.value = base64.b64decode(node.text)
-            elif not self.is_uninitialized() \
-                    and not self.has_children:
-                self.value = node.text
-
-        if self.value is None:
-            self.value = ""
+                if node.text is not None:
+                    value = base64.b64decode(node.text)
+            elif not self.is_uninitialized():
+                value = node.text
 
-        self.num_crs = self.value.count('\n')
-
-    def __determine_type(self, node):
-        nodetype = node.get('classname')
-        if nodetype is None:
-            nodetype = node.get('type')
-        if nodetype is None:
-            nodetype = 'unknown'
-        self.type = nodetype
+        if value is None:
+            return ""
+        return value
 
     def _determine_displayname(self, node):
         display_name = node.get('fullname')
@@ -615,7 +1109,7 @@ class ContextProperty:
             display_name = self._get_enc_node_text(node, 'fullname', "")
         if display_name == '::':
             display_name = self.type
-        self.display_name = display_name
+        return display_name
 
     def _get_enc_node_text(self, node, name, default=None):
         n = node.find('%s%s' % (self.ns, name))
@@ -631,32 +1125,17 @@ class ContextProperty:
         else:
             return val
 
-    def _determine_children(self, node):
-        children = node.get('numchildren')
-        if children is None:
-            children = node.get('children')
-        if children is None:
-            children = 0
-        else:
-            children = int(children)
-
-        self.num_declared_children = children
-        self.has_children = True if children > 0 else False
-        self.children = []
-
     def __init_children(self, node):
+        children = []
         if self.has_children:
-            idx = 0
             tagname = '%sproperty' % self.ns
-            children = list(node)
-            if children is not None:
-                for c in children:
-                    if c.tag == tagname:
-                        idx += 1
-                        p = self._create_child(c, self, self.depth + 1)
-                        self.children.append(p)
-                        if idx == self.num_declared_children:
-                            p.mark_as_last_child()
+            for c in node:
+                if c.tag == tagname:
+                    p = self._create_child(c, self, self.depth + 1)
+                    children.append(p)
+                    if len(children) == self.num_declared_children:
+                        p.mark_as_last_child()
+        return children
 
     def _create_child(self, node, parent, depth):
         return ContextProperty(node, parent, depth)
@@ -673,6 +1152,16 @@ class ContextProperty:
     def child_count(self):
         return len(self.children)
 
+    def is_truncated(self):
+        """Whether the debugger left out part of this property, because of
+        the max_data, max_children or max_depth features."""
+        if self.has_children:
+            return self.child_count() < self.num_declared_children
+        try:
+            return int(self.size) > len(self.value)
+        except (TypeError, ValueError):
+            return False
+
     def type_and_size(self):
         size = None
         if self.has_children:
@@ -687,30 +1176,27 @@ class ContextProperty:
 
 
 class EvalProperty(ContextProperty):
+    __slots__ = ('code', 'language')
+
     def __init__(self, node, code, language, parent=None, depth=0):
+        ContextProperty.__init__(self, node, parent, depth)
         self.code = code
         self.language = language.lower()
-        self.display_name = '?'
 
-        if parent is None:
-            self.is_parent = True
-        else:
-            self.is_parent = False
-        ContextProperty.__init__(self, node, parent, depth)
+    @property
+    def is_parent(self):
+        return self.parent is None
 
     def _create_child(self, node, parent, depth):
         return EvalProperty(node, self.code, self.language, parent, depth)
 
     def _determine_displayname(self, node):
         if self.is_parent:
-            self.display_name = self.code
+            return self.code
+        elif self.parent.type == 'array':
+            return "%s['%s']" % (self.parent.display_name, node.get('name'))
         else:
-            if self.parent.type == 'array':
-                self.display_name = "%s['%s']" % (self.parent.display_name,
-                                                  node.get('name'))
-            else:
-                self.display_name = "%s -> %s" % (self.parent.display_name,
-                                                  node.get('name'))
+            return "%s -> %s" % (self.parent.display_name, node.get('name'))
 
 
 # Errors/Exceptions
@@ -1,10 +1,30 @@
 # -*- coding: utf-8 -*-
 
 """
-Contains the Event class.
+Contains the Event class and the EventSerializer that writes events to
+reports.
 """
 
-from utils import t
+import re
+
+
+_TEXT_SPECIAL = re.compile(r'[&<>]')
+_ATTR_SPECIAL = re.compile(r'[&<>"]')
+
+
+def escape_text(s):
+    """Escapes a string for use as element content."""
+    if _TEXT_SPECIAL.search(s) is None:
+        return s
+    return s.replace('&', '&amp;').replace('<', '&lt;').replace('>', '&gt;')
+
+
+def escape_attr(s):
+    """Escapes a string for use in a double-quoted attribute."""
+    if _ATTR_SPECIAL.search(s) is None:
+        return s
+    return s.replace('&', '&amp;').replace('<', '&lt;').replace('>', '&gt;') \
+        .replace('"', '&quot;')
 
 
 class Event(object):
@@ -18,46 +38,48 @@ class Event(object):
     RISKY = 4
     BAD = 5
 
-    t = None
-    call = None
-    args = None
+    __slots__ = (
+        't',
+        'call',
+        'args',
+
+        # The stack, as XML
+        'stack',
+
+        # Id of the stack in the report's stack table, if it is kept there
+        'stack_id',
 
-    stack = None
+        # Where the call was made, as 'file:line'
+        'site',
 
-    level = None
-    tags = None
+        'level',
+        'tags',
+
+        # Indexes of the arguments that the debugger cut short
+        'truncated',
+
+        # Whether the debugger left out arguments altogether
+        'args_truncated',
+    )
 
     def __init__(self, **kwargs):
-        self.level = 0
-        self.tags = set()
+        self.t = None
+        self.call = ""
         self.args = list()
         self.stack = ""
-        self.call = ""
+        self.stack_id = None
+        self.site = None
+        self.level = 0
+        self.tags = set()
+        self.truncated = frozenset()
+        self.args_truncated = False
 
         for key, value in kwargs.items():
             setattr(self, key, value)
 
     def to_xml(self):
         """Returns an XML representation of this Event."""
-        out = list()
-        out.append('<event t="%s" call="%s">' % (self.t.isoformat(), self.call))
-        out.append(t('level', self.LEVELS[self.level]))
-
-        for tag in self.tags:
-            out.append(t('tag', tag))
-
-        out.append('<frames>')
-        out.append(self.stack)
-        out.append('</frames>')
-
-        out.append('<args>')
-        for arg in self.args:
-            out.append(t('arg', arg))
-        out.append('</args>')
-
-        out.append('</event>')
-
-        return ''.join(out)
+        return EventSerializer().serialize(self)
 
     def bump(self, lvl):
         """
@@ -75,3 +97,70 @@ class Event(object):
         @param tag: The tag to add as a string.
         """
         self.tags.add(tag)
+
+
+class EventSerializer(object):
+    """
+    Turns Events into report XML. Markup that doesn't depend on the event is
+    prepared up front, values are only escaped when they need to be, and the
+    list that the fragments are collected in is reused from event to event.
+
+    A serializer is meant to be used by one thread (session) at a time.
+    """
+
+    LEVELS = ['<level>%s</level>' % level for level in Event.LEVELS]
+
+    def __init__(self):
+        # Fragments of the event being serialized
+        self.out = []
+
+        # Tag name -> its markup
+        self.tags = dict()
+
+    def serialize(self, ev):
+        """
+        Returns the XML for an Event.
+
+        @param ev: The Event.
+        """
+        out = self.out
+        add = out.append
+
+        # Drop whatever an event that failed halfway left behind
+        del out[:]
+
+        add('<event t="')
+        add(ev.t.isoformat())
+        add('" call="')
+        add(escape_attr(ev.call or ''))
+        add('">')
+        add(self.LEVELS[ev.level])
+
+        for tag in ev.tags:
+            markup = self.tags.get(tag)
+            if markup is None:
+                markup = self.tags[tag] = '<tag>%s</tag>' % escape_text(tag)
+            add(markup)
+
+        if ev.stack_id is not None:
+            add('<frames ref="%s"/>' % ev.stack_id)
+        else:
+            add('<frames>')
+            add(ev.stack)
+            add('</frames>')
+
+        add('<args truncated="true">' if ev.args_truncated else '<args>')
+        truncated = ev.truncated
+        for (i, arg) in enumerate(ev.args):
+            if not isinstance(arg, str):
+                arg = arg.encode('utf-8') if isinstance(arg, unicode) \
+                    else str(arg)
+            add('<arg truncated="true">' if truncated and i in truncated
+                else '<arg>')
+            add(escape_text(arg))
+            add('</arg>')
+        add('</args></event>')
+
+        xml = ''.join(out)
+        del out[:]
+        return xml
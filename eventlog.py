@@ -0,0 +1,303 @@
+# -*- coding: utf-8 -*-
+
+"""
+Contains the compact binary event log format: the EventLogEncoder that
+produces it, and the EventLog reader that scans it through mmap.
+
+An event log starts with the MAGIC bytes, followed by records. Every record
+is a little-endian uint32 length, a one-byte record type and the payload:
+
+    S  string definition: uint32 id, then the string itself
+    H  session header: double created, uint32 ids of the start file, user
+       and process, uint16 number of rulesets, then their uint32 ids
+    E  event: double t, uint8 level, uint32 call id, uint16 number of tags,
+       frames and arguments; then the tag ids, a (where, filename, lineno)
+       triple of uint32s per frame and, per argument, a uint32 length
+       followed by its value
+
+Call names, tags, file URIs and other repetitive strings are interned: each
+is written once as an S record, before its first use, and referred to by id
+afterwards. Unknown record types are skipped by the reader, so the format can
+grow new ones.
+"""
+
+import datetime
+import mmap
+import re
+import struct
+import time
+from xml.sax.saxutils import unescape
+
+
+MAGIC = b'IODOGEL\x01'
+
+RECORD = struct.Struct('<IB')
+STRING = struct.Struct('<I')
+HEADER = struct.Struct('<dIIIH')
+EVENT = struct.Struct('<dBIHHH')
+ID = struct.Struct('<I')
+FRAME = struct.Struct('<III')
+
+STRING_RECORD = ord('S')
+HEADER_RECORD = ord('H')
+EVENT_RECORD = ord('E')
+
+FRAME_TAG = re.compile(r'<stack\s([^>]*)>')
+FRAME_ATTR = re.compile(r'(where|filename|lineno)="([^"]*)"')
+ENTITIES = {'&quot;': '"', '&apos;': "'"}
+
+
+def _bytes(s):
+    """Returns s as a byte string."""
+    if not isinstance(s, bytes):
+        s = s.encode('utf-8')
+    return s
+
+
+def _epoch(dt):
+    """Returns a local datetime as seconds since the epoch."""
+    return time.mktime(dt.timetuple()) + dt.microsecond / 1e6
+
+
+def _record(kind, payload):
+    return RECORD.pack(len(payload) + 1, kind) + payload
+
+
+class EventLogEncoder(object):
+    """Turns a session and its events into event log records."""
+
+    # Interned strings: string -> id
+    # @type dict[str, int]
+    ids = None
+
+    def __init__(self):
+        self.ids = dict()
+
+    def intern(self, s, out):
+        """
+        Returns the id for a string, adding a definition record for it to out
+        if it is new.
+
+        @param s: The string.
+        @param out: List of records being built.
+        """
+        s = _bytes(s)
+        sid = self.ids.get(s)
+        if sid is None:
+            sid = self.ids[s] = len(self.ids)
+            out.append(_record(STRING_RECORD, STRING.pack(sid) + s))
+        return sid
+
+    def header(self, created, startfile, user, process, rulesets):
+        """
+        Returns the start of an event log: the magic bytes and the session
+        header.
+
+        @param created: When the session started, as a datetime.
+        @param startfile: The script's file URI.
+        @param user: The user running the script.
+        @param process: The process ID.
+        @param rulesets: The names of the active rulesets.
+        """
+        out = [MAGIC]
+        ids = [self.intern(s, out) for s in (startfile, user, process)]
+        rs = [self.intern(str(r), out) for r in rulesets]
+
+        payload = HEADER.pack(_epoch(created), ids[0], ids[1], ids[2],
+                              len(rs))
+        payload += b''.join([ID.pack(r) for r in rs])
+        out.append(_record(HEADER_RECORD, payload))
+        return b''.join(out)
+
+    def event(self, ev):
+        """
+        Returns the records for an Event.
+
+        @param ev: The Event.
+        """
+        out = []
+        call = self.intern(ev.call or '', out)
+        tags = [self.intern(tag, out) for tag in sorted(ev.tags)]
+
+        frames = []
+        for match in FRAME_TAG.finditer(ev.stack):
+            attrs = dict(FRAME_ATTR.findall(match.group(1)))
+            lineno = attrs.get('lineno', '0')
+            frames.append(FRAME.pack(
+                self.intern(unescape(attrs.get('where', ''), ENTITIES), out),
+                self.intern(unescape(attrs.get('filename', ''), ENTITIES),
+                            out),
+                int(lineno) if lineno.isdigit() else 0))
+
+        args = [_bytes(arg) for arg in ev.args]
+
+        payload = [EVENT.pack(_epoch(ev.t), ev.level, call, len(tags),
+                              len(frames), len(args))]
+        payload.extend([ID.pack(tag) for tag in tags])
+        payload.extend(frames)
+        for arg in args:
+            payload.append(ID.pack(len(arg)))
+            payload.append(arg)
+
+        out.append(_record(EVENT_RECORD, b''.join(payload)))
+        return b''.join(out)
+
+
+class EventLog(object):
+    """
+    Reads an event log. The file is mapped into memory and records are
+    decoded in place, only as far as they are looked at.
+
+    Iterating over an EventLog yields a LogEvent per event. A log that was
+    cut short (say, by a crash) ends at its last complete record.
+    """
+
+    # The mapped file
+    # @type mmap.mmap
+    mm = None
+
+    # Interned strings: id -> string, filled in while iterating
+    # @type dict[int, str]
+    strings = None
+
+    # Session header fields; set once the header record has been read
+    created = None
+    file = None
+    user = None
+    process = None
+    rulesets = None
+
+    def __init__(self, filename):
+        """
+        @param filename: The event log to open.
+        """
+        self.strings = dict()
+
+        with open(filename, 'rb') as f:
+            self.mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        if self.mm[:len(MAGIC)] != MAGIC:
+            self.mm.close()
+            raise ValueError("%s is not an iodog event log" % filename)
+
+        # Read up to and including the header
+        for _ in self.__records(stop_at_event=True):
+            pass
+
+    def close(self):
+        """Unmaps the file."""
+        self.mm.close()
+
+    def string(self, sid):
+        """
+        Returns an interned string.
+
+        @param sid: The string's id.
+        """
+        return self.strings[sid]
+
+    def __iter__(self):
+        return self.__records()
+
+    def __records(self, stop_at_event=False):
+        mm = self.mm
+        size = len(mm)
+        offset = len(MAGIC)
+        strings = self.strings
+        unpack_record = RECORD.unpack_from
+
+        while offset + RECORD.size <= size:
+            (length, kind) = unpack_record(mm, offset)
+            body = offset + RECORD.size
+            end = body + length - 1
+            if end > size:
+                return
+
+            if kind == EVENT_RECORD:
+                if stop_at_event:
+                    return
+                yield LogEvent(self, body)
+            elif kind == STRING_RECORD:
+                sid = STRING.unpack_from(mm, body)[0]
+                strings[sid] = mm[body + STRING.size:end]
+            elif kind == HEADER_RECORD:
+                self.__read_header(body)
+
+            offset = end
+
+    def __read_header(self, offset):
+        (created, startfile, user, process, count) = \
+            HEADER.unpack_from(self.mm, offset)
+        offset += HEADER.size
+
+        self.created = datetime.datetime.fromtimestamp(created)
+        self.file = self.strings[startfile]
+        self.user = self.strings[user]
+        self.process = self.strings[process]
+        self.rulesets = [self.strings[ID.unpack_from(self.mm, offset + i *
+                                                     ID.size)[0]]
+                         for i in range(count)]
+
+
+class LogEvent(object):
+    """An event in an EventLog. Fields are decoded when accessed."""
+
+    __slots__ = ('log', 'offset')
+
+    def __init__(self, log, offset):
+        self.log = log
+        self.offset = offset
+
+    def __fields(self):
+        return EVENT.unpack_from(self.log.mm, self.offset)
+
+    @property
+    def t(self):
+        """When the event happened, as a datetime."""
+        return datetime.datetime.fromtimestamp(self.__fields()[0])
+
+    @property
+    def level(self):
+        """The event's level; see Event.LEVELS."""
+        return self.__fields()[1]
+
+    @property
+    def call(self):
+        """The called function."""
+        return self.log.strings[self.__fields()[2]]
+
+    @property
+    def tags(self):
+        """The event's tags, as a list."""
+        count = self.__fields()[3]
+        offset = self.offset + EVENT.size
+        return [self.log.strings[sid] for sid in
+                struct.unpack_from('<%dI' % count, self.log.mm, offset)]
+
+    @property
+    def frames(self):
+        """The stack, as a list of (where, filename, lineno) tuples."""
+        (_, _, _, tags, count, _) = self.__fields()
+        offset = self.offset + EVENT.size + tags * ID.size
+        strings = self.log.strings
+        frames = []
+        for i in range(count):
+            (where, filename, lineno) = \
+                FRAME.unpack_from(self.log.mm, offset + i * FRAME.size)
+            frames.append((strings[where], strings[filename], lineno))
+        return frames
+
+    @property
+    def args(self):
+        """The call's arguments, as a list of strings."""
+        (_, _, _, tags, frames, count) = self.__fields()
+        offset = self.offset + EVENT.size + tags * ID.size + \
+            frames * FRAME.size
+        mm = self.log.mm
+        args = []
+        for _ in range(count):
+            length = ID.unpack_from(mm, offset)[0]
+            offset += ID.size
+            args.append(mm[offset:offset + length])
+            offset += length
+        return args
@@ -0,0 +1,489 @@
+# -*- coding: utf-8 -*-
+
+"""
+Contains the Index class, a SQLite database of the events in a directory of
+iodog reports, and the 'iodog index' and 'iodog query' commands on top of it.
+"""
+
+import argparse
+import glob
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import xml.etree.ElementTree as ElementTree
+
+from event import Event
+from report import open_report
+
+
+SCHEMA_VERSION = 3
+
+SCHEMA = """
+CREATE TABLE reports (
+    id INTEGER PRIMARY KEY,
+    path TEXT UNIQUE NOT NULL,
+    size INTEGER,
+    mtime REAL,
+    complete INTEGER,
+    created TEXT,
+    file TEXT,
+    user TEXT,
+    process TEXT,
+    events INTEGER
+);
+
+CREATE TABLE events (
+    report INTEGER NOT NULL,
+    seq INTEGER NOT NULL,
+    t TEXT,
+    call TEXT,
+    level INTEGER,
+    args TEXT,
+    stack TEXT
+);
+
+CREATE TABLE stacks (
+    id TEXT PRIMARY KEY,
+    frames TEXT
+);
+
+CREATE TABLE tags (
+    report INTEGER NOT NULL,
+    seq INTEGER NOT NULL,
+    tag TEXT
+);
+
+CREATE INDEX reports_created ON reports (created, id);
+CREATE UNIQUE INDEX events_report ON events (report, seq);
+CREATE INDEX events_call ON events (call);
+CREATE INDEX events_level ON events (level);
+CREATE INDEX tags_tag ON tags (tag);
+CREATE INDEX tags_event ON tags (report, seq);
+"""
+
+# File names that are picked up as reports
+PATTERNS = ["iodog_*.xml", "iodog_*.xml.gz", "iodog_*.xml.xz"]
+
+
+class Index(object):
+    """
+    An index over iodog reports. Reports are read with a streaming parser,
+    so their size doesn't matter, and only new or changed reports are read
+    again on update.
+
+    Stacks are stored once in the stacks table, as JSON lists of
+    [where, filename, lineno], and referred to from events by id.
+    """
+
+    # @type sqlite3.Connection
+    db = None
+
+    # How many events to insert at a time
+    BATCH = 1000
+
+    def __init__(self, path):
+        """
+        Opens the index, creating it if needed.
+
+        @param path: The database file.
+        """
+        self.db = sqlite3.connect(path)
+        self.db.execute("PRAGMA synchronous = NORMAL")
+
+        version = self.db.execute("PRAGMA user_version").fetchone()[0]
+        if version != SCHEMA_VERSION:
+            self.__create()
+
+    def __create(self):
+        """(Re)creates the schema, dropping whatever was there."""
+        with self.db:
+            for (table,) in self.db.execute(
+                    "SELECT name FROM sqlite_master WHERE type = 'table'"
+                    ).fetchall():
+                self.db.execute("DROP TABLE %s" % table)
+            self.db.executescript(SCHEMA)
+            self.db.execute("PRAGMA user_version = %d" % SCHEMA_VERSION)
+
+    def close(self):
+        self.db.close()
+
+    def update(self, directory):
+        """
+        Brings the index up to date with the reports in a directory: new and
+        changed reports are (re)indexed, removed ones are dropped.
+
+        Returns the number of reports that were (re)indexed.
+
+        @param directory: The directory holding the reports.
+        """
+        known = dict()
+        for (rid, path, size, mtime) in self.db.execute(
+                "SELECT id, path, size, mtime FROM reports"):
+            known[path] = (rid, size, mtime)
+
+        paths = set()
+        for pattern in PATTERNS:
+            paths.update(glob.glob(os.path.join(directory, pattern)))
+
+        count = 0
+        forgotten = False
+        for path in sorted(paths):
+            path = os.path.abspath(path)
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+
+            old = known.pop(path, None)
+            if old is not None and old[1:] == (st.st_size, st.st_mtime):
+                continue
+
+            with self.db:
+                if old is not None:
+                    self.__forget(old[0])
+                    forgotten = True
+                self.add(path, st.st_size, st.st_mtime)
+            count += 1
+
+        with self.db:
+            for (rid, size, mtime) in known.values():
+                self.__forget(rid)
+                forgotten = True
+            if forgotten:
+                # NOT IN is never true once the subquery has a NULL in it
+                self.db.execute("DELETE FROM stacks WHERE id NOT IN "
+                                "(SELECT stack FROM events "
+                                "WHERE stack IS NOT NULL)")
+
+        return count
+
+    def __forget(self, rid):
+        """Removes a report from the index."""
+        self.db.execute("DELETE FROM tags WHERE report = ?", (rid,))
+        self.db.execute("DELETE FROM events WHERE report = ?", (rid,))
+        self.db.execute("DELETE FROM reports WHERE id = ?", (rid,))
+
+    def add(self, path, size, mtime):
+        """
+        Indexes a single report. A report that is cut short (because it is
+        still being written, for instance) is indexed as far as it goes.
+
+        @param path: The report file.
+        @param size: Its size, to notice changes later on.
+        @param mtime: Its modification time, idem.
+        """
+        cur = self.db.execute(
+            "INSERT INTO reports (path, size, mtime, complete) "
+            "VALUES (?, ?, ?, 0)", (path, size, mtime))
+        rid = cur.lastrowid
+
+        header = dict()
+        events = []
+        tags = []
+        stacks = dict()
+        seq = 0
+        container = None
+
+        source = open_report(path)
+        try:
+            for (kind, elem) in ElementTree.iterparse(source, ("start",
+                                                               "end")):
+                if kind == "start":
+                    if elem.tag in ("events", "stacks"):
+                        container = elem
+                    continue
+
+                if elem.tag == "event":
+                    seq += 1
+                    level = elem.findtext("level", "unknown")
+                    events.append((rid, seq, elem.get("t"), elem.get("call"),
+                                   Event.LEVELS.index(level)
+                                   if level in Event.LEVELS else 0,
+                                   json.dumps([arg.text or "" for arg in
+                                               elem.findall("args/arg")]),
+                                   self.__stack(elem.find("frames"), stacks)))
+                    for tag in elem.findall("tag"):
+                        tags.append((rid, seq, tag.text))
+
+                    container.clear()
+                    if len(events) >= self.BATCH:
+                        self.__flush(events, tags, stacks)
+                elif elem.tag == "frames" and elem.get("id") is not None:
+                    # An entry in the report's stack table
+                    stacks[elem.get("id")] = self.__frames(elem)
+                    container.clear()
+                elif container is None and elem.tag in ("created", "file",
+                                                        "user", "process"):
+                    header[elem.tag] = elem.text
+            complete = 1
+        except (ElementTree.ParseError, IOError, EOFError):
+            logging.debug("%s is incomplete" % path)
+            complete = 0
+        finally:
+            source.close()
+
+        self.__flush(events, tags, stacks)
+        self.db.execute(
+            "UPDATE reports SET complete = ?, created = ?, file = ?, "
+            "user = ?, process = ?, events = ? WHERE id = ?",
+            (complete, header.get("created") or "", header.get("file"),
+             header.get("user"), header.get("process"), seq, rid))
+
+    @staticmethod
+    def __frames(frames):
+        """Returns the stack in a frames element as JSON."""
+        return json.dumps([(stack.get("where"), stack.get("filename"),
+                            int(stack.get("lineno") or 0))
+                           for stack in frames.findall("stack")])
+
+    def __stack(self, frames, stacks):
+        """
+        Returns the id of an event's stack. Inline stacks are added to the
+        given dict of stacks to insert, by the hash of their contents.
+        """
+        if frames is None:
+            return None
+        if frames.get("ref") is not None:
+            return frames.get("ref")
+
+        data = self.__frames(frames)
+        sid = hashlib.sha1(data).hexdigest()[:16]
+        stacks[sid] = data
+        return sid
+
+    def __flush(self, events, tags, stacks):
+        """Inserts and empties the given lists (and dict) of rows."""
+        self.db.executemany("INSERT INTO events VALUES (?, ?, ?, ?, ?, ?, ?)",
+                            events)
+        self.db.executemany("INSERT INTO tags VALUES (?, ?, ?)", tags)
+        self.db.executemany("INSERT OR IGNORE INTO stacks VALUES (?, ?)",
+                            stacks.items())
+        del events[:]
+        del tags[:]
+        stacks.clear()
+
+    def query(self, call=None, level=None, tag=None, user=None, file=None,
+              limit=None):
+        """
+        Finds events. All criteria are optional and combined with AND.
+
+        Returns (path, t, call, level, tags, args) tuples, ordered by report
+        and then by position in the report.
+
+        @param call: The called function.
+        @param level: The minimum level, as a number.
+        @param tag: A tag the event must have.
+        @param user: The user the script ran as.
+        @param file: The script's file URI.
+        @param limit: The maximum number of events to return.
+        """
+        (where, params) = self.__where(call, level, tag, user, file)
+        sql = ("SELECT r.path, e.t, e.call, e.level, e.args, "
+               "(SELECT group_concat(tag, ',') FROM tags g "
+               " WHERE g.report = e.report AND g.seq = e.seq) "
+               "FROM events e JOIN reports r ON r.id = e.report" + where +
+               " ORDER BY e.report, e.seq")
+        if limit:
+            sql += " LIMIT %d" % int(limit)
+
+        for (path, t, call, level, args, tags) in self.db.execute(sql,
+                                                                  params):
+            yield (path, t, call, level, tags.split(",") if tags else [],
+                   json.loads(args))
+
+    def reports(self, call=None, level=None, tag=None, user=None, file=None):
+        """
+        Finds the reports that contain matching events; see query().
+
+        Returns (path, file, user, process, count) tuples, where count is the
+        number of matching events in the report.
+        """
+        (where, params) = self.__where(call, level, tag, user, file)
+        sql = ("SELECT r.path, r.file, r.user, r.process, count(*) "
+               "FROM events e JOIN reports r ON r.id = e.report" + where +
+               " GROUP BY r.id ORDER BY r.created")
+        return self.db.execute(sql, params).fetchall()
+
+    def page(self, report=None, call=None, level=None, tag=None, after=None,
+             limit=100):
+        """
+        Returns a page of events. Pages are found by position rather than
+        by offset, so any page costs the same to fetch.
+
+        Returns (report, seq, t, call, level, tags, args, stack) tuples, in
+        the same order as query().
+
+        @param report: The id of the report the events are in.
+        @param call: The called function.
+        @param level: The minimum level, as a number.
+        @param tag: A tag the event must have.
+        @param after: The (report, seq) of the last event on the previous
+                      page, if any.
+        @param limit: The maximum number of events to return.
+        """
+        (where, params) = self.__where(call, level, tag, None, None)
+        clauses = [where[len(" WHERE "):]] if where else []
+        if report is not None:
+            clauses.append("e.report = ?")
+            params.append(report)
+        if after is not None:
+            clauses.append("(e.report > ? OR (e.report = ? AND e.seq > ?))")
+            params.extend((after[0], after[0], after[1]))
+
+        sql = ("SELECT e.report, e.seq, e.t, e.call, e.level, "
+               "(SELECT group_concat(tag, ',') FROM tags g "
+               " WHERE g.report = e.report AND g.seq = e.seq), "
+               "e.args, e.stack FROM events e")
+        if clauses:
+            sql += " WHERE " + " AND ".join(clauses)
+        sql += " ORDER BY e.report, e.seq LIMIT %d" % int(limit)
+
+        return [(rid, seq, t, call, level, tags.split(",") if tags else [],
+                 json.loads(args), stack)
+                for (rid, seq, t, call, level, tags, args, stack)
+                in self.db.execute(sql, params)]
+
+    def report(self, rid):
+        """
+        Returns (path, complete, created, file, user, process) for a report,
+        or None if there is no such report.
+
+        @param rid: The report's id.
+        """
+        return self.db.execute(
+            "SELECT path, complete, created, file, user, process "
+            "FROM reports WHERE id = ?", (rid,)).fetchone()
+
+    def report_page(self, after=None, limit=100):
+        """
+        Returns a page of reports, newest first. Like page(), this finds
+        pages by position rather than by offset.
+
+        Returns (id, path, complete, created, file, user, process, events)
+        tuples.
+
+        @param after: The id of the last report on the previous page, if
+                      any.
+        @param limit: The maximum number of reports to return.
+        """
+        sql = ("SELECT id, path, complete, created, file, user, process, "
+               "events FROM reports")
+        params = []
+        if after is not None:
+            row = self.db.execute("SELECT created FROM reports WHERE id = ?",
+                                  (after,)).fetchone()
+            if row is None:
+                raise ValueError("no report %d" % after)
+            sql += " WHERE (created, id) < (?, ?)"
+            params = [row[0], after]
+        sql += " ORDER BY created DESC, id DESC LIMIT %d" % int(limit)
+        return self.db.execute(sql, params).fetchall()
+
+    def frames(self, sids):
+        """
+        Returns a dict from stack id to a list of (where, filename, lineno).
+
+        @param sids: The ids of the stacks to look up.
+        """
+        sids = [sid for sid in set(sids) if sid is not None]
+        if not sids:
+            return dict()
+        sql = "SELECT id, frames FROM stacks WHERE id IN (%s)" % \
+            ", ".join("?" * len(sids))
+        return dict((sid, [tuple(frame) for frame in json.loads(frames)])
+                    for (sid, frames) in self.db.execute(sql, sids))
+
+    @staticmethod
+    def __where(call, level, tag, user, file):
+        clauses = []
+        params = []
+        if call is not None:
+            clauses.append("e.call = ?")
+            params.append(call)
+        if level is not None:
+            clauses.append("e.level >= ?")
+            params.append(level)
+        if tag is not None:
+            clauses.append("EXISTS (SELECT 1 FROM tags g WHERE g.tag = ? AND "
+                           "g.report = e.report AND g.seq = e.seq)")
+            params.append(tag)
+        if user is not None:
+            clauses.append("r.user = ?")
+            params.append(user)
+        if file is not None:
+            clauses.append("r.file = ?")
+            params.append(file)
+
+        if not clauses:
+            return ("", params)
+        return (" WHERE " + " AND ".join(clauses), params)
+
+
+def add_index_args(parser):
+    """Adds the options common to all commands that use an Index."""
+    parser.add_argument("--dir", default=".",
+                        help="directory with the reports (default: .)")
+    parser.add_argument("--db", default=None,
+                        help="index database (default: iodog.db in --dir)")
+
+
+def open_index(args, update=True):
+    """Opens (and by default updates) the Index described by args."""
+    index = Index(args.db or os.path.join(args.dir, "iodog.db"))
+    if update:
+        count = index.update(args.dir)
+        logging.debug("Indexed %d report(s)" % count)
+    return index
+
+
+def index_command(argv):
+    """The 'iodog index' command: brings the index up to date."""
+    parser = argparse.ArgumentParser(
+        prog="iodog index",
+        description="Index iodog reports for 'iodog query'.")
+    add_index_args(parser)
+    args = parser.parse_args(argv)
+
+    open_index(args).close()
+
+
+def query_command(argv):
+    """The 'iodog query' command: finds events in the indexed reports."""
+    parser = argparse.ArgumentParser(
+        prog="iodog query",
+        description="Find events in iodog reports. The index is brought up "
+                    "to date first, unless --no-update is given.")
+    add_index_args(parser)
+    parser.add_argument("--no-update", action="store_true",
+                        help="don't look for new or changed reports")
+    parser.add_argument("--call", help="the called function")
+    parser.add_argument("--level", choices=Event.LEVELS,
+                        help="the minimum level")
+    parser.add_argument("--tag", help="a tag the event has")
+    parser.add_argument("--user", help="the user the script ran as")
+    parser.add_argument("--file", help="the script's file URI")
+    parser.add_argument("--reports", action="store_true",
+                        help="list matching reports instead of events")
+    parser.add_argument("--limit", type=int, help="show at most this many "
+                                                  "events")
+    args = parser.parse_args(argv)
+
+    index = open_index(args, update=not args.no_update)
+    level = Event.LEVELS.index(args.level) if args.level else None
+    criteria = (args.call, level, args.tag, args.user, args.file)
+
+    if args.reports:
+        for (path, file, user, process, count) in index.reports(*criteria):
+            line = u"%s\t%s\t%s\t%s\t%d" % (path, file, user, process, count)
+            print(line.encode("utf-8"))
+    else:
+        for (path, t, call, level, tags, arglist) in \
+                index.query(*criteria, limit=args.limit):
+            line = u"%s\t%s\t%s\t%s('%s')\t%s" % (
+                os.path.basename(path), t, Event.LEVELS[level], call,
+                u"', '".join(arglist), u",".join(tags))
+            print(line.encode("utf-8"))
+
+    index.close()
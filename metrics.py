@@ -0,0 +1,242 @@
+# -*- coding: utf-8 -*-
+
+"""
+Contains the Metrics class, which keeps latency histograms and counters,
+and a small HTTP server that exposes them in the Prometheus text format.
+
+Every session keeps its own Metrics, summarized at the end of its report,
+and passes everything on to the process-wide REGISTRY, which is what the
+HTTP endpoint shows.
+"""
+
+import bisect
+import BaseHTTPServer
+import logging
+import threading
+
+from utils import t
+
+
+# Upper bounds of the histogram buckets, in seconds
+BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+           0.1, 0.25, 0.5, 1.0, 2.5)
+
+# Metric families: name -> (type, label name, help text)
+FAMILIES = {
+    'iodog_dbgp_command_seconds':
+        ('histogram', 'command', 'Round trip time of DBGp commands.'),
+    'iodog_annotate_seconds':
+        ('histogram', 'ruleset', 'Time rulesets spend annotating an event.'),
+    'iodog_sessions_total':
+        ('counter', None, 'Debugger sessions started.'),
+    'iodog_events_total':
+        ('counter', 'level', 'Events written, by level.'),
+}
+
+
+class Histogram(object):
+    """Counts observations into BUCKETS."""
+
+    def __init__(self):
+        # Observations per bucket; the last one is for anything larger
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(BUCKETS, value)] += 1
+        self.count += 1
+        self.sum += value
+        if value > self.max:
+            self.max = value
+
+    def merge(self, counts, count, total, maximum):
+        """Adds the observations of another histogram, see snapshot()."""
+        self.counts = [a + b for (a, b) in zip(self.counts, counts)]
+        self.count += count
+        self.sum += total
+        self.max = max(self.max, maximum)
+
+
+class Metrics(object):
+    """A set of histograms and counters, each labelled with one value."""
+
+    # Where observations are passed on to, if anywhere
+    # @type Metrics
+    parent = None
+
+    # (family, label) -> Histogram
+    # @type dict[tuple, Histogram]
+    histograms = None
+
+    # (family, label) -> number
+    # @type dict[tuple, int]
+    counters = None
+
+    def __init__(self, parent=None):
+        """
+        @param parent: Metrics to pass every observation on to.
+        """
+        self.parent = parent
+        self.histograms = dict()
+        self.counters = dict()
+        self.lock = threading.Lock()
+
+    def observe(self, family, label, value):
+        """
+        Adds an observation to a histogram.
+
+        @param family: The metric family; see FAMILIES.
+        @param label: The value of the family's label.
+        @param value: The observed duration, in seconds.
+        """
+        key = (family, label)
+        with self.lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = Histogram()
+            histogram.observe(value)
+
+        if self.parent is not None:
+            self.parent.observe(family, label, value)
+
+    def inc(self, family, label=None, n=1):
+        """
+        Increments a counter.
+
+        @param family: The metric family; see FAMILIES.
+        @param label: The value of the family's label, if it has one.
+        @param n: How much to add.
+        """
+        key = (family, label)
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + n
+
+        if self.parent is not None:
+            self.parent.inc(family, label, n)
+
+    def snapshot(self):
+        """
+        Returns a copy of all metrics as plain data, which can be pickled
+        and passed to merge(), e.g. in another process.
+        """
+        with self.lock:
+            return dict(
+                histograms=dict((key, (list(h.counts), h.count, h.sum, h.max))
+                                for (key, h) in self.histograms.items()),
+                counters=dict(self.counters))
+
+    def merge(self, snapshot):
+        """
+        Adds the metrics from a snapshot() to these.
+
+        @param snapshot: The snapshot to add.
+        """
+        with self.lock:
+            for (key, data) in snapshot['histograms'].items():
+                histogram = self.histograms.get(key)
+                if histogram is None:
+                    histogram = self.histograms[key] = Histogram()
+                histogram.merge(*data)
+            for (key, n) in snapshot['counters'].items():
+                self.counters[key] = self.counters.get(key, 0) + n
+
+    def render(self):
+        """Returns all metrics in the Prometheus text exposition format."""
+        with self.lock:
+            histograms = sorted(self.histograms.items())
+            counters = sorted(self.counters.items())
+
+        out = []
+        for name in sorted(FAMILIES):
+            (kind, label_name, text) = FAMILIES[name]
+            out.append("# HELP %s %s" % (name, text))
+            out.append("# TYPE %s %s" % (name, kind))
+
+            for ((family, label), histogram) in histograms:
+                if family != name:
+                    continue
+                labels = '%s="%s"' % (label_name, _quote(label))
+                total = 0
+                for (bound, count) in zip(BUCKETS + ('+Inf',),
+                                          histogram.counts):
+                    total += count
+                    out.append('%s_bucket{%s,le="%s"} %d'
+                               % (name, labels, bound, total))
+                out.append("%s_sum{%s} %r" % (name, labels, histogram.sum))
+                out.append("%s_count{%s} %d" % (name, labels,
+                                                histogram.count))
+
+            for ((family, label), count) in counters:
+                if family != name:
+                    continue
+                if label_name is None:
+                    out.append("%s %d" % (name, count))
+                else:
+                    out.append('%s{%s="%s"} %d'
+                               % (name, label_name, _quote(label), count))
+
+        return "\n".join(out) + "\n"
+
+    def to_xml(self):
+        """Returns a summary of the histograms for a report."""
+        with self.lock:
+            histograms = sorted(self.histograms.items())
+
+        out = ['<metrics>']
+        for ((family, label), histogram) in histograms:
+            (kind, label_name, text) = FAMILIES[family]
+            out.append(t('timing', kind=label_name, name=str(label),
+                         count=str(histogram.count),
+                         total="%.6f" % histogram.sum,
+                         max="%.6f" % histogram.max))
+        out.append('</metrics>')
+        return ''.join(out)
+
+
+def _quote(value):
+    """Escapes a label value for the text format."""
+    return str(value).replace('\\', '\\\\').replace('"', '\\"') \
+        .replace('\n', '\\n')
+
+
+# The metrics of this process
+REGISTRY = Metrics()
+
+
+class MetricsHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    """Serves the server's metrics on /metrics."""
+
+    def do_GET(self):
+        if self.path.split('?', 1)[0] != '/metrics':
+            self.send_error(404)
+            return
+
+        body = self.server.metrics.render()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def serve(port, host='127.0.0.1', metrics=REGISTRY):
+    """
+    Serves metrics over HTTP on a background thread.
+
+    @param port: The port to listen on.
+    @param host: The address to listen on.
+    @param metrics: The Metrics to serve. To serve others later on, set the
+                    returned server's metrics attribute.
+    """
+    server = BaseHTTPServer.HTTPServer((host, port), MetricsHandler)
+    server.metrics = metrics
+    thread = threading.Thread(target=server.serve_forever, name="metrics")
+    thread.daemon = True
+    thread.start()
+    logging.info("Metrics on http://%s:%d/metrics" % (host, port))
+    return server
@@ -0,0 +1,160 @@
+# -*- coding: utf-8 -*-
+
+"""
+Contains the ProcessInfo class and a cache of them, read from /proc.
+
+PHP-FPM workers serve many requests each, so the same processes show up over
+and over. Process IDs get reused, though, so the cache is keyed on the PID
+together with the process' start time.
+"""
+
+import collections
+import datetime
+import os
+import pwd
+import threading
+
+
+class ProcessInfo(object):
+    """What is known about a process. Fields are None when unknown."""
+
+    pid = None
+    uid = None
+    user = None
+    cmdline = None
+    cwd = None
+
+    # When the process started
+    # @type datetime.datetime
+    started = None
+
+    def __init__(self, pid, **kwargs):
+        self.pid = pid
+        self.user = "unknown"
+
+        for key, value in kwargs.items():
+            setattr(self, key, value)
+
+
+class ProcessCache(object):
+    """Least recently used cache of ProcessInfo objects."""
+
+    # (pid, start time in clock ticks) -> ProcessInfo
+    # @type collections.OrderedDict
+    entries = None
+
+    def __init__(self, size=1024, proc="/proc"):
+        """
+        @param size: How many processes to remember.
+        @param proc: Where procfs is mounted.
+        """
+        self.size = size
+        self.proc = proc
+        self.entries = collections.OrderedDict()
+        self.lock = threading.Lock()
+
+    def lookup(self, pid):
+        """
+        Returns a ProcessInfo for the given process. Processes that can't be
+        found (on another host, say, or already gone) get one with only the
+        pid filled in.
+
+        @param pid: The process ID, as a string or number.
+        """
+        try:
+            pid = int(pid)
+            ticks = self.__start_ticks(pid)
+        except (ValueError, IOError, OSError):
+            return ProcessInfo(pid)
+
+        key = (pid, ticks)
+        with self.lock:
+            info = self.entries.pop(key, None)
+            if info is not None:
+                self.entries[key] = info
+                return info
+
+        info = self.__read(pid, ticks)
+
+        with self.lock:
+            self.entries[key] = info
+            while len(self.entries) > self.size:
+                self.entries.popitem(last=False)
+        return info
+
+    def __path(self, pid, name):
+        return os.path.join(self.proc, str(pid), name)
+
+    def __start_ticks(self, pid):
+        """Reads a process' start time, in clock ticks after boot."""
+        with open(self.__path(pid, "stat")) as f:
+            stat = f.read()
+
+        # The command name is in parentheses and may contain anything, so
+        # count fields from the last closing one. starttime is field 22;
+        # the state right after the name is field 3.
+        fields = stat[stat.rindex(")") + 2:].split()
+        return int(fields[22 - 3])
+
+    def __read(self, pid, ticks):
+        """Reads everything else there is to know about a process."""
+        info = ProcessInfo(pid)
+
+        try:
+            with open(self.__path(pid, "status")) as f:
+                for line in f:
+                    if line.startswith("Uid:"):
+                        # Real, effective, saved and filesystem UID
+                        info.uid = int(line.split()[2])
+                        break
+        except IOError:
+            pass
+
+        if info.uid is not None:
+            try:
+                info.user = pwd.getpwuid(info.uid).pw_name
+            except KeyError:
+                info.user = str(info.uid)
+
+        try:
+            with open(self.__path(pid, "cmdline")) as f:
+                info.cmdline = " ".join(f.read().rstrip("\0").split("\0"))
+        except IOError:
+            pass
+
+        try:
+            info.cwd = os.readlink(self.__path(pid, "cwd"))
+        except OSError:
+            pass
+
+        boot = self.__boot_time()
+        if boot is not None:
+            seconds = float(ticks) / os.sysconf("SC_CLK_TCK")
+            info.started = boot + datetime.timedelta(seconds=seconds)
+
+        return info
+
+    def __boot_time(self):
+        """Returns when the system booted, if known."""
+        try:
+            with open(os.path.join(self.proc, "stat")) as f:
+                for line in f:
+                    if line.startswith("btime "):
+                        return datetime.datetime.fromtimestamp(
+                            int(line.split()[1]))
+        except IOError:
+            pass
+        return None
+
+
+# The process cache shared by all sessions
+_cache = ProcessCache()
+
+
+def lookup(pid):
+    """
+    Returns a ProcessInfo for the given process; see ProcessCache.lookup.
+
+    @param pid: The process ID, as a string or number.
+    """
+    return _cache.lookup(pid)
@@ -0,0 +1,327 @@
+# -*- coding: utf-8 -*-
+
+"""
+Contains 'iodog replay', which runs recorded DBGp transcripts (see
+transcript.py and 'iodog --record') through the current rulesets, without
+PHP. Sessions are replayed at full speed, on several processes at once, and
+each one gets a new report, as if the requests had just happened.
+
+The debugger's side of a session is played back from the transcript: every
+break is seen again, with the stack and the arguments that were recorded.
+Commands whose outcome doesn't depend on the script, such as breakpoint_set
+and feature_set, are simply acknowledged. When a ruleset now wants the
+arguments of a call that they weren't recorded for, the event gets none.
+"""
+
+import argparse
+import collections
+import datetime
+import glob
+import json
+import logging
+import multiprocessing
+import os
+import re
+import time
+
+from procinfo import ProcessInfo
+from report import ReportWriter, COMPRESSORS
+from session import Session
+import transcript
+
+
+class ReplayConnection(object):
+    """Stands in for a dbgp.Connection, answering from a transcript."""
+
+    address = None
+
+    # What the transcript's header says about the debugged process
+    # @type dict
+    header = None
+
+    # The recorded status and run responses, as (time, message)
+    # @type collections.deque
+    statuses = None
+
+    # Recorded stack_get and eval responses, by command name, for each
+    # run of the script: before the first run command, after it, and so on
+    # @type list[dict[str, str]]
+    segments = None
+
+    # Replies to be received, in order
+    # @type collections.deque
+    replies = None
+
+    # When the last status or run response was recorded
+    time = None
+
+    # Runs so far, i.e. the current segment
+    runs = 0
+
+    # Breaks whose arguments are wanted but weren't recorded
+    missing = 0
+
+    TRANSACTION_ID = re.compile(r'\stransaction_id="(\d+)"')
+    COMMAND_ID = re.compile(r' -i (\d+)')
+
+    def __init__(self, filename):
+        """
+        @param filename: The transcript to play back.
+        """
+        self.address = (filename, 0)
+        self.statuses = collections.deque()
+        self.segments = [dict()]
+        self.replies = collections.deque()
+
+        # Recorded commands, by transaction ID
+        sent = dict()
+        for (direction, t, payload) in transcript.read_transcript(filename):
+            if direction == transcript.HEADER:
+                self.header = json.loads(payload)
+            elif direction == transcript.SENT:
+                match = self.COMMAND_ID.search(payload)
+                if match is not None:
+                    sent[match.group(1)] = payload.split(' ', 1)[0]
+            elif not self.replies:
+                # The init message
+                self.replies.append(payload)
+                self.time = t
+            else:
+                match = self.TRANSACTION_ID.search(payload)
+                cmd = sent.get(match.group(1)) if match else None
+                if cmd == 'run':
+                    self.segments.append(dict())
+                if cmd in ('status', 'run'):
+                    self.statuses.append((t, payload))
+                elif cmd in ('stack_get', 'eval'):
+                    self.segments[-1][cmd] = payload
+
+        if self.header is None or not self.replies:
+            raise ValueError("%s has no session in it" % filename)
+
+    def isconnected(self):
+        return 1
+
+    def open(self):
+        pass
+
+    def close(self):
+        pass
+
+    def recv_msg(self):
+        return self.replies.popleft()
+
+    def send_msg(self, cmd):
+        self.replies.append(self.answer(cmd))
+
+    def send_msgs(self, cmds):
+        for cmd in cmds:
+            self.send_msg(cmd)
+
+    def answer(self, cmd):
+        """Returns the reply to a command."""
+        name = cmd.split(' ', 1)[0]
+        match = self.COMMAND_ID.search(cmd)
+        tid = match.group(1) if match else '0'
+
+        msg = None
+        if name in ('status', 'run'):
+            if name == 'run':
+                self.runs += 1
+            if self.statuses:
+                (self.time, msg) = self.statuses.popleft()
+            else:
+                msg = self.response(name, tid,
+                                    ' status="stopping" reason="ok"')
+        elif name in ('stack_get', 'eval'):
+            if self.runs < len(self.segments):
+                msg = self.segments[self.runs].get(name)
+            if msg is None:
+                if name == 'eval':
+                    self.missing += 1
+                msg = self.response(name, tid)
+        elif name == 'breakpoint_set':
+            msg = self.response(name, tid, ' id="%s"' % tid)
+        elif name == 'feature_set':
+            msg = self.response(name, tid, ' success="1"')
+        else:
+            msg = self.response(name, tid)
+
+        return self.TRANSACTION_ID.sub(' transaction_id="%s"' % tid, msg, 1)
+
+    def response(self, cmd, tid, attrs=''):
+        return ('<?xml version="1.0" encoding="iso-8859-1"?>\n<response '
+                'xmlns="urn:debugger_protocol_v1" command="%s" '
+                'transaction_id="%s"%s></response>' % (cmd, tid, attrs))
+
+
+class ReplaySession(Session):
+    """A Session whose debugger is a ReplayConnection."""
+
+    def now(self):
+        return datetime.datetime.fromtimestamp(self.api.conn.time)
+
+    def process_info(self):
+        header = self.api.conn.header
+        proc = ProcessInfo(self.api.appid, user=header['user'],
+                           uid=header['uid'], cmdline=header['cmdline'],
+                           cwd=header['cwd'])
+        if header['started'] is not None:
+            proc.started = datetime.datetime.fromtimestamp(header['started'])
+        return proc
+
+
+class Replayer(object):
+    """
+    Replays transcripts into reports. Has the settings that a Session
+    expects of the Iodog instance that runs it.
+    """
+
+    # Where reports are written
+    directory = ""
+
+    # @type ReportWriter
+    writer = None
+
+    durability = None
+    compression = None
+    binlog = False
+    stack_table = False
+    disarm_after = None
+    analysis = None
+    transcripts = False
+
+    # @type dict[str, int]
+    limits = None
+
+    def __init__(self, directory, compression=None, binlog=False,
+                 stack_table=False):
+        """
+        @param directory: Where to write the reports.
+        @param compression: How reports are compressed, if at all.
+        @param binlog: Whether to also write binary event logs.
+        @param stack_table: Whether reports get a table of distinct stacks.
+        """
+        self.directory = directory
+        self.compression = compression
+        self.binlog = binlog
+        self.stack_table = stack_table
+        self.limits = dict()
+
+    def replay(self, filename):
+        """
+        Replays a transcript. Returns (transcript, report, events, breaks
+        missing arguments).
+
+        @param filename: The transcript to replay.
+        """
+        conn = ReplayConnection(filename)
+        self.writer = ReportWriter()
+        try:
+            session = ReplaySession(self, conn)
+            session.run()
+        finally:
+            self.writer.stop()
+        return (filename, session.report.file.name, session.written,
+                conn.missing)
+
+
+# The Replayer of a worker process
+_replayer = None
+
+
+def _init_worker(*args):
+    global _replayer
+    _replayer = Replayer(*args)
+
+
+def _replay(filename):
+    try:
+        return _replayer.replay(filename)
+    except Exception:
+        logging.exception("Could not replay %s" % filename)
+        return (filename, None, 0, 0)
+
+
+def find_transcripts(paths):
+    """
+    Returns the transcripts to replay: the given files, and the transcripts
+    in the given directories.
+
+    @param paths: Files and directories.
+    """
+    found = []
+    for path in paths:
+        if os.path.isdir(path):
+            found.extend(sorted(glob.glob(os.path.join(path,
+                                                       "iodog_*.dbgp*"))))
+        else:
+            found.append(path)
+    return found
+
+
+def replay_command(argv):
+    """The 'iodog replay' command: runs transcripts through the rulesets."""
+    parser = argparse.ArgumentParser(
+        prog="iodog replay",
+        description="Run sessions recorded with 'iodog --record' through "
+                    "the current rulesets, and write new reports for them.")
+    parser.add_argument("transcripts", nargs="+", metavar="PATH",
+                        help="transcripts (iodog_*.dbgp.gz), or directories "
+                             "with transcripts")
+    parser.add_argument("--out", default="replay",
+                        help="directory to write the reports to "
+                             "(default: replay)")
+    parser.add_argument("--processes", type=int,
+                        default=multiprocessing.cpu_count(),
+                        help="number of processes to replay on "
+                             "(default: one per CPU)")
+    parser.add_argument("--compress", choices=sorted(COMPRESSORS),
+                        help="compress the reports")
+    parser.add_argument("--binlog", action="store_true",
+                        help="also write binary event logs")
+    parser.add_argument("--stack-table", action="store_true",
+                        help="write each distinct stack only once per report")
+    parser.add_argument("--verbose", action="store_true",
+                        help="log every session's progress")
+    args = parser.parse_args(argv)
+
+    if not args.verbose:
+        logging.getLogger().setLevel(logging.WARNING)
+    if not os.path.isdir(args.out):
+        os.makedirs(args.out)
+
+    filenames = find_transcripts(args.transcripts)
+    settings = (args.out, args.compress, args.binlog, args.stack_table)
+    start = time.time()
+
+    if args.processes > 1 and len(filenames) > 1:
+        pool = multiprocessing.Pool(args.processes, _init_worker, settings)
+        results = pool.imap_unordered(_replay, filenames)
+    else:
+        pool = None
+        _init_worker(*settings)
+        results = (_replay(filename) for filename in filenames)
+
+    (sessions, events, missing) = (0, 0, 0)
+    try:
+        for (filename, report, count, unrecorded) in results:
+            if report is None:
+                print("%s: failed" % filename)
+                continue
+            print("%s -> %s: %d events" % (filename, report, count))
+            sessions += 1
+            events += count
+            missing += unrecorded
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+
+    elapsed = time.time() - start
+    print("%d of %d sessions, %d events in %.2f s (%.0f events/s)"
+          % (sessions, len(filenames), events, elapsed,
+             events / elapsed if elapsed else 0))
+    if missing:
+        print("%d events are missing arguments that weren't recorded"
+              % missing)
@@ -0,0 +1,191 @@
+# -*- coding: utf-8 -*-
+
+"""
+Contains the ReportWriter and Report classes, which get reports onto disk
+without making the debugged PHP process wait for it, and open_report, which
+reads them back.
+"""
+
+import gzip
+import logging
+import os
+import Queue
+import threading
+
+try:
+    import lzma
+except ImportError:
+    lzma = None
+
+
+# Compression formats: name -> (file name suffix, magic bytes, opener)
+COMPRESSORS = {
+    'gzip': ('.gz', '\x1f\x8b', lambda name, mode: gzip.open(name, mode, 6)),
+}
+
+if lzma is not None:
+    COMPRESSORS['lzma'] = ('.xz', '\xfd7zXZ\x00', lzma.open)
+
+
+def open_report(filename):
+    """
+    Opens a report for reading, decompressing it if needed. Compressed
+    reports are recognized by their contents, not their name.
+
+    @param filename: The report to open.
+    """
+    with open(filename, 'rb') as f:
+        head = f.read(6)
+
+    for (suffix, magic, opener) in COMPRESSORS.values():
+        if head.startswith(magic):
+            return opener(filename, 'rb')
+
+    return open(filename, 'rb')
+
+
+class ReportWriter(object):
+    """
+    Background thread that writes report data to disk.
+
+    Sessions hand their serialized events to the writer through a bounded
+    queue and carry on with the debugger right away. Only when the disk falls
+    behind by more than the queue holds do they have to wait.
+    """
+
+    # Queue of (report, data, is_event) tuples
+    # @type Queue.Queue
+    queue = None
+
+    # @type threading.Thread
+    thread = None
+
+    # Marks the end of a report (as data) or of the writer (as report)
+    CLOSE = object()
+
+    def __init__(self, maxsize=4096):
+        """
+        @param maxsize: How many writes may be queued before writers block.
+        """
+        self.queue = Queue.Queue(maxsize)
+        self.thread = threading.Thread(target=self.run, name="report-writer")
+        self.thread.daemon = True
+        self.thread.start()
+
+    def open(self, filename, durability=None, compression=None,
+             binary=False):
+        """
+        Creates a report file.
+
+        @param filename: The file to write. When compressing, the suffix for
+                         the compression format is added to it.
+        @param durability: When to flush and fsync the file: None never does,
+                           'session' does so when the report is closed, and a
+                           number N also after every N events.
+        @param compression: None, or one of the COMPRESSORS to compress the
+                            report with while it is written.
+        @param binary: Whether the report is binary rather than text.
+        """
+        if compression is None:
+            return Report(self, open(filename, "wb" if binary else "w"),
+                          durability)
+
+        (suffix, magic, opener) = COMPRESSORS[compression]
+        return Report(self, opener(filename + suffix, 'wb'), durability)
+
+    def run(self):
+        """Writes queued data until stop() is called."""
+        while True:
+            (report, data, is_event) = self.queue.get()
+            if report is self.CLOSE:
+                return
+
+            try:
+                if data is self.CLOSE:
+                    report.finish()
+                else:
+                    report.flush_write(data, is_event)
+            except Exception:
+                # Whatever went wrong, keep writing the other reports
+                logging.exception("Could not write %s" % report.file.name)
+                report.failed = True
+
+    def stop(self):
+        """Writes everything that is still queued, then stops the thread."""
+        self.queue.put((self.CLOSE, None, False))
+        self.thread.join()
+
+
+class Report(object):
+    """A report file that is written by a ReportWriter."""
+
+    # @type ReportWriter
+    writer = None
+
+    # The file being written; its name is in file.name
+    # @type file
+    file = None
+
+    # Flush policy, see ReportWriter.open
+    durability = None
+
+    # Events written since the last sync
+    # @type int
+    pending = 0
+
+    # Whether writing to the file failed; later writes are dropped
+    # @type bool
+    failed = False
+
+    def __init__(self, writer, file, durability):
+        self.writer = writer
+        self.file = file
+        self.durability = durability
+        self.pending = 0
+
+    def write(self, data):
+        """
+        Queues data to be written.
+
+        @param data: The string to write.
+        """
+        self.writer.queue.put((self, data, False))
+
+    def write_event(self, data):
+        """
+        Queues a serialized event to be written. Unlike write(), this counts
+        towards the every-N-events flush policy.
+
+        @param data: The serialized event.
+        """
+        self.writer.queue.put((self, data, True))
+
+    def close(self):
+        """Queues the end of the report; the file is closed once written."""
+        self.writer.queue.put((self, ReportWriter.CLOSE, False))
+
+    def flush_write(self, data, is_event):
+        """Writes data to the file. Called on the writer thread."""
+        if self.failed:
+            return
+
+        self.file.write(data)
+
+        if is_event and isinstance(self.durability, int):
+            self.pending += 1
+            if self.pending >= self.durability:
+                self.sync()
+
+    def finish(self):
+        """Syncs and closes the file. Called on the writer thread."""
+        try:
+            if self.durability is not None and not self.failed:
+                self.sync()
+        finally:
+            self.file.close()
+
+    def sync(self):
+        """Makes sure everything written so far is on disk."""
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        self.pending = 0
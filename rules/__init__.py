@@ -5,18 +5,30 @@ Contains rules that allow iodog to decide whether a certain behaviour is
 suspicious or not.
 """
 
+import glob
+import os
+
 
 def get_rulesets(app):
     """
-    Returns an instance of each registered ruleset.
+    Returns an instance of each registered ruleset, followed by one for every
+    other *.rules file in this directory.
 
     @param app: The Iodog instance to pass on to the ruleset.
     """
     from rules import blacklist, mysql, fileio, netio
+    from rules.rulefile import RuleFileRuleset, RULES_DIR
 
-    return [
+    rulesets = [
         blacklist.Blacklist(app),
         mysql.Mysql(app),
         fileio.FileIO(app),
         netio.NetIO(app),
     ]
+
+    claimed = set(rs.RULES for rs in rulesets)
+    for path in sorted(glob.glob(os.path.join(RULES_DIR, "*.rules"))):
+        if os.path.basename(path) not in claimed:
+            rulesets.append(RuleFileRuleset(app, os.path.basename(path)))
+
+    return rulesets
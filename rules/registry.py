@@ -0,0 +1,236 @@
+# -*- coding: utf-8 -*-
+
+"""
+Keeps track of which rulesets care about which breakpoints.
+"""
+
+import time
+
+
+# Debugger features that limit fetched arguments, in the order of the
+# limit tuples below
+FEATURES = ('max_data', 'max_children')
+
+
+class Registry(object):
+    """
+    Merges the TRIGGERS of all rulesets, registers each function with the
+    debugger only once, and hands events to the rulesets that own them.
+    """
+
+    # All active rulesets
+    # @type list[Ruleset]
+    rulesets = None
+
+    # Function name -> rulesets that trigger on it
+    # @type dict[str, list[Ruleset]]
+    owners = None
+
+    # Function name -> breakpoint id
+    # @type dict[str, int]
+    ids = None
+
+    # Breakpoint id -> rulesets that own it
+    # @type dict[int, list[Ruleset]]
+    breakpoints = None
+
+    # Ruleset -> its name, for the metrics
+    # @type dict[Ruleset, str]
+    names = None
+
+    # The (max_data, max_children) that arguments are fetched with
+    # @type tuple
+    fetched = (0, 0)
+
+    # The limits of rulesets that don't set their own, by debugger feature
+    # @type dict[str, int]
+    defaults = None
+
+    # Ruleset -> the (max_data, max_children) it asked for
+    # @type dict[Ruleset, tuple]
+    limits = None
+
+    # Function name -> the (max_data, max_children) its arguments are kept
+    # with in the report
+    # @type dict[str, tuple]
+    kept = None
+
+    # Where annotate timings are recorded, if anywhere
+    # @type metrics.Metrics
+    metrics = None
+
+    def __init__(self, rulesets, metrics=None):
+        """
+        @param rulesets: The rulesets to dispatch to.
+        @param metrics: A metrics.Metrics to time the rulesets with, if any.
+        """
+        self.rulesets = rulesets
+        self.metrics = metrics
+        self.names = dict((ruleset, str(ruleset)) for ruleset in rulesets)
+        self.owners = dict()
+        self.ids = dict()
+        self.breakpoints = dict()
+        self.defaults = dict()
+        self.limits = dict((ruleset, _limits(ruleset, self.defaults))
+                           for ruleset in rulesets)
+        self.kept = dict()
+
+        for ruleset in rulesets:
+            for fn in ruleset.TRIGGERS:
+                self.owners.setdefault(fn, []).append(ruleset)
+
+    def register(self, api):
+        """
+        Creates one breakpoint per function, in a single batch.
+
+        @param api: The dbgp.Api to register the breakpoints with.
+        """
+        calls = sorted(self.owners)
+        for fn, res in zip(calls, api.breakpoint_set_calls(calls)):
+            bp = res.get_id()
+            self.ids[fn] = bp
+            self.breakpoints[bp] = self.owners[fn]
+
+        for ruleset in self.rulesets:
+            ruleset.register()
+
+    def owners_of(self, event):
+        """
+        Returns the rulesets that own the breakpoint that caused an event.
+        Events that don't belong to a known breakpoint go to all rulesets.
+
+        @param event: The event to look up.
+        """
+        bp = self.ids.get(event.call)
+        if bp is None:
+            return self.rulesets
+        return self.breakpoints[bp]
+
+    def wants_args(self, call):
+        """
+        Whether any ruleset that could see a call to the given function needs
+        its arguments.
+
+        @param call: The function name.
+        """
+        owners = self.owners.get(call, self.rulesets)
+        for ruleset in owners:
+            if ruleset.wants_args(call):
+                return True
+        return False
+
+    def negotiate(self, defaults):
+        """
+        Works out the limits on fetching arguments for the whole session:
+        for each feature, the most generous limit of the rulesets that need
+        arguments at all, where 0 means no limit. They are set once, so that
+        breaks don't have to change them back and forth.
+
+        Every ruleset still sees arguments cut down to its own limits, and
+        the report keeps no more of a call's arguments than the rulesets
+        that wanted them asked for; see annotate().
+
+        Returns the limits, by debugger feature.
+
+        @param defaults: The limits for rulesets that don't set their own.
+        """
+        self.defaults = defaults
+        self.limits = dict((ruleset, _limits(ruleset, defaults))
+                           for ruleset in self.rulesets)
+        self.kept = dict()
+
+        self.fetched = _limits(None, defaults)
+        for ruleset in self.rulesets:
+            if ruleset.ARGS:
+                self.fetched = _widest(self.fetched, self.limits[ruleset])
+
+        limits = dict(defaults)
+        for (feature, limit) in zip(FEATURES, self.fetched):
+            if feature in defaults:
+                limits[feature] = limit
+        return limits
+
+    def kept_limits(self, call):
+        """
+        Returns the (max_data, max_children) that the arguments of a call
+        are kept with: the most generous limits of the rulesets that want
+        them, or the defaults if none does.
+
+        @param call: The function name.
+        """
+        kept = self.kept.get(call)
+        if kept is None:
+            kept = _limits(None, self.defaults)
+            wanting = [self.limits[ruleset]
+                       for ruleset in self.owners.get(call, self.rulesets)
+                       if ruleset.wants_args(call)]
+            if wanting:
+                kept = reduce(_widest, wanting)
+            self.kept[call] = kept
+        return kept
+
+    def annotate(self, event):
+        """
+        Lets the owning rulesets annotate the given Event, each seeing the
+        arguments cut down to its own limits, then cuts the event's
+        arguments down to what the report keeps of them.
+
+        @param event: The event to annotate.
+        """
+        args = event.args
+        try:
+            for ruleset in self.owners_of(event):
+                own = self.limits[ruleset]
+                event.args = args if own == self.fetched else _cut(args, *own)
+
+                if self.metrics is None:
+                    ruleset.annotate(event)
+                    continue
+
+                start = time.time()
+                ruleset.annotate(event)
+                self.metrics.observe('iodog_annotate_seconds',
+                                     self.names[ruleset],
+                                     time.time() - start)
+        finally:
+            event.args = args
+
+        kept = self.kept_limits(event.call)
+        if args and kept != self.fetched:
+            event.args = _cut(args, *kept)
+            event.truncated = event.truncated | frozenset(
+                i for (i, arg) in enumerate(event.args) if arg != args[i])
+            if len(event.args) < len(args):
+                event.args_truncated = True
+
+
+def _limits(ruleset, defaults):
+    """
+    Returns the (max_data, max_children) a ruleset asked for, or the
+    defaults for None.
+    """
+    own = ruleset.LIMITS if ruleset is not None else dict()
+    return tuple(own.get(feature, defaults.get(feature, 0))
+                 for feature in FEATURES)
+
+
+def _widest(limits, other):
+    """
+    Returns the more generous of two limit tuples, feature by feature. A
+    limit of 0 means no limit.
+    """
+    return tuple(0 if not a or not b else max(a, b)
+                 for (a, b) in zip(limits, other))
+
+
+def _cut(args, max_data, max_children):
+    """
+    Cuts arguments down to the given limits, as if the debugger had
+    applied them. A limit of 0 means no limit.
+    """
+    if max_children:
+        args = args[:max_children]
+    if max_data:
+        args = [arg[:max_data] if isinstance(arg, basestring) else arg
+                for arg in args]
+    return args
@@ -0,0 +1,326 @@
+# -*- coding: utf-8 -*-
+
+"""
+Loads rulesets written in iodog's declarative rule format.
+
+A rule file is a list of blocks. Each block starts with an unindented header
+that ends in a colon, followed by the indented names of the functions the
+block applies to:
+
+    # Comments start with a hash sign
+    risky +blacklist:
+        exec passthru
+        shell_exec system
+
+    suspicious if arg0 !startswith "SELECT ":
+        mysql_query mysqli_query
+
+A header holds, in any order, a level (unknown, harmless, interesting,
+suspicious, risky or bad) that events are bumped to, and any number of +tags
+that are added to them. It may end with 'if' and one or more predicates
+joined by 'and'; the block then only applies when all of them hold. A
+predicate compares an argument (arg0 is the first) to a string with one of
+==, !=, startswith, endswith, contains or matches (a regular expression
+search); prefix the operator with ! to negate it. A missing argument never
+matches.
+
+Fetching a call's arguments from the debugger costs an extra round trip, so
+it is only done for functions that need it: those with a predicate, and
+those in a block whose header contains the 'args' keyword.
+
+How much of the arguments is kept is bounded by max_data (bytes per
+argument) and max_children (number of arguments), which default to iodog's
+--max-data and --max-children. A rule file can set its own limits, where 0
+means no limit, with unindented 'set' lines:
+
+    set max_data 65536
+
+The limits apply to all functions in the file. Arguments are fetched with
+the most generous limits of all rule files, and then cut down to the limits
+of the file for its rules, and to the most generous limits of the files
+that want them for the report.
+
+Loading a file compiles it into a table from function name to actions, so
+annotating an event costs one dict lookup plus the predicates for that one
+function, however many rules there are.
+"""
+
+import os
+import re
+import shlex
+
+from rules.ruleset import Ruleset
+from event import Event
+
+
+# Path of the directory that holds the shipped rule files
+RULES_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+class RuleSyntaxError(Exception):
+    """Raised when a rule file can't be parsed."""
+    pass
+
+
+class RuleFile(object):
+    """A compiled rule file."""
+
+    OPERATORS = {
+        "==": lambda arg, value: arg == value,
+        "startswith": lambda arg, value: arg.startswith(value),
+        "endswith": lambda arg, value: arg.endswith(value),
+        "contains": lambda arg, value: value in arg,
+        "matches": lambda arg, value: value.search(arg) is not None,
+    }
+
+    ARG = re.compile(r'^arg(\d+)$')
+
+    # Debugger features that 'set' lines may change
+    FEATURES = ("max_data", "max_children")
+
+    # Source file name
+    # @type str
+    path = None
+
+    # Function name -> (level, tags, [(predicates, level, tags)])
+    # @type dict
+    table = None
+
+    # Functions whose arguments are needed
+    # @type set[str]
+    args = None
+
+    # Limits on fetched arguments, by debugger feature
+    # @type dict[str, int]
+    limits = None
+
+    def __init__(self, path):
+        """
+        Parses and compiles the given rule file.
+
+        @param path: The path to the rule file.
+        """
+        self.path = path
+        self.table = dict()
+        self.args = set()
+        self.limits = dict()
+
+        with open(path) as source:
+            for header, calls in self._blocks(source):
+                self._compile(header, calls)
+
+    @property
+    def triggers(self):
+        """The set of functions any of the rules apply to."""
+        return set(self.table)
+
+    def actions(self, call):
+        """
+        Returns the actions for a function, or None if there are none.
+
+        @param call: The function name.
+        """
+        return self.table.get(call)
+
+    def _error(self, lineno, msg):
+        return RuleSyntaxError("%s:%d: %s" % (self.path, lineno, msg))
+
+    def _blocks(self, source):
+        """Yields (header, calls) for every block in the file."""
+        header = None
+        calls = []
+
+        for lineno, line in enumerate(source, 1):
+            if not line.split('#', 1)[0].strip():
+                continue
+
+            if line[0] in ' \t':
+                if header is None:
+                    raise self._error(lineno, "function outside of a block")
+                calls.extend(line.split('#', 1)[0].replace(',', ' ').split())
+                continue
+
+            if header is not None:
+                yield header, calls
+
+            try:
+                tokens = shlex.split(line, comments=True)
+            except ValueError as e:
+                raise self._error(lineno, str(e))
+
+            if tokens and tokens[0] == 'set':
+                header = None
+                self._set(lineno, tokens[1:])
+                continue
+
+            if not tokens or not tokens[-1].endswith(':'):
+                raise self._error(lineno, "block header must end with ':'")
+            tokens[-1] = tokens[-1][:-1]
+            if not tokens[-1]:
+                tokens.pop()
+
+            header = (lineno, tokens)
+            calls = []
+
+        if header is not None:
+            yield header, calls
+
+    def _set(self, lineno, tokens):
+        """Handles a 'set' line."""
+        if len(tokens) != 2 or tokens[0] not in self.FEATURES:
+            raise self._error(lineno, "expected 'set <%s> <number>'"
+                              % "|".join(self.FEATURES))
+        if not tokens[1].isdigit():
+            raise self._error(lineno, "expected a number, got '%s'"
+                              % tokens[1])
+        self.limits[tokens[0]] = int(tokens[1])
+
+    def _compile(self, header, calls):
+        """Adds the block with the given header to the table."""
+        (lineno, tokens) = header
+        level = Event.UNKNOWN
+        tags = set()
+        predicates = []
+        args = False
+
+        tokens = iter(tokens)
+        for token in tokens:
+            if token in Event.LEVELS:
+                level = Event.LEVELS.index(token)
+            elif token.startswith('+') and len(token) > 1:
+                tags.add(token[1:])
+            elif token == 'args':
+                args = True
+            elif token == 'if':
+                predicates = self._predicates(lineno, list(tokens))
+            else:
+                raise self._error(lineno, "unexpected '%s'" % token)
+
+        if not calls:
+            raise self._error(lineno, "block has no functions")
+
+        if args or predicates:
+            self.args.update(calls)
+
+        for call in calls:
+            (base_level, base_tags, conditional) = \
+                self.table.get(call, (Event.UNKNOWN, frozenset(), ()))
+
+            if predicates:
+                conditional += ((tuple(predicates), level, frozenset(tags)),)
+            else:
+                base_level = max(base_level, level)
+                base_tags = base_tags | tags
+
+            self.table[call] = (base_level, base_tags, conditional)
+
+    def _predicates(self, lineno, tokens):
+        """Compiles the tokens after 'if' into a list of predicates."""
+        predicates = []
+
+        while True:
+            if len(tokens) < 3:
+                raise self._error(lineno, "incomplete condition")
+            (arg, op, value), tokens = tokens[:3], tokens[3:]
+
+            match = self.ARG.match(arg)
+            if match is None:
+                raise self._error(lineno, "expected argN, got '%s'" % arg)
+
+            negate = op.startswith('!') and op != '!='
+            if op == '!=':
+                op = '=='
+                negate = True
+            elif negate:
+                op = op[1:]
+
+            if op not in self.OPERATORS:
+                raise self._error(lineno, "unknown operator '%s'" % op)
+            if op == 'matches':
+                try:
+                    value = re.compile(value)
+                except re.error as e:
+                    raise self._error(lineno, "bad expression: %s" % e)
+
+            predicates.append(self._predicate(
+                int(match.group(1)), self.OPERATORS[op], value, negate))
+
+            if not tokens:
+                return predicates
+            if tokens[0] != 'and':
+                raise self._error(lineno, "expected 'and', got '%s'"
+                                  % tokens[0])
+            tokens = tokens[1:]
+
+    @staticmethod
+    def _predicate(index, compare, value, negate):
+        def predicate(args):
+            if index >= len(args):
+                return False
+            return compare(args[index], value) != negate
+        return predicate
+
+
+# Compiled rule files, by path
+_cache = dict()
+
+
+def load(path):
+    """
+    Returns the compiled rule file at the given path, compiling it on first
+    use.
+
+    @param path: The path to the rule file.
+    """
+    path = os.path.abspath(path)
+    if path not in _cache:
+        _cache[path] = RuleFile(path)
+    return _cache[path]
+
+
+class RuleFileRuleset(Ruleset):
+    """Ruleset whose rules come from a rule file."""
+
+    # The rule file, relative to the rules directory
+    RULES = None
+
+    # The compiled rule file
+    # @type RuleFile
+    rules = None
+
+    def __init__(self, app, path=None):
+        """
+        @param app: The Iodog session.
+        @param path: The rule file to use, if RULES isn't set.
+        """
+        Ruleset.__init__(self, app)
+        self.rules = load(os.path.join(RULES_DIR, path or self.RULES))
+        self.TRIGGERS = self.rules.triggers
+        self.ARGS = self.rules.args
+        self.LIMITS = self.rules.limits
+
+    def annotate(self, event):
+        """Applies the rules for the called function."""
+        actions = self.rules.actions(event.call)
+        if actions is None:
+            return
+
+        (level, tags, conditional) = actions
+        event.bump(level)
+        for tag in tags:
+            event.add_tag(tag)
+
+        for (predicates, level, tags) in conditional:
+            for predicate in predicates:
+                if not predicate(event.args):
+                    break
+            else:
+                event.bump(level)
+                for tag in tags:
+                    event.add_tag(tag)
+
+    def __str__(self):
+        if self.RULES is None:
+            name = os.path.splitext(os.path.basename(self.rules.path))[0]
+            return self.__module__.split('.')[0] + "." + name
+        return Ruleset.__str__(self)
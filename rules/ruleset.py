@@ -7,13 +7,36 @@ class Ruleset():
     """Superclass for all the ruleset classes."""
     app = None
 
+    # Functions to break on
+    TRIGGERS = set()
+
+    # Functions whose arguments annotate() looks at. Arguments are only
+    # fetched from the debugger when a ruleset asks for them.
+    ARGS = set()
+
+    # Limits on the arguments this ruleset sees, by debugger feature
+    # (max_data, max_children), where 0 means no limit. Features that
+    # aren't set here use iodog's defaults.
+    LIMITS = dict()
+
     def __init__(self, iodog):
         self.app = iodog
 
     def register(self):
-        """Set up this Ruleset with the debugger."""
+        """
+        Set up this Ruleset with the debugger. Breakpoints for the functions
+        in TRIGGERS are created by the Registry; this is for anything else.
+        """
         return
 
+    def wants_args(self, call):
+        """
+        Whether this Ruleset needs the arguments of the given function.
+
+        @param call: The function name.
+        """
+        return call in self.ARGS
+
     def annotate(self, event):
         """
         Investigate the given Event, adding more info if possible.
@@ -0,0 +1,319 @@
+# -*- coding: utf-8 -*-
+
+"""
+Contains the 'iodog serve' command: a small web server for browsing the
+events in a directory of reports.
+
+Unlike opening a report through style-0.1.xsl, which has the browser load and
+filter the whole report, the server works from the index (see index.py) and
+only ever sends one page of events. Big reports are as quick to browse as
+small ones.
+
+Pages:
+
+    /                 the indexed reports, newest first, a page at a time
+    /events           events, filtered by the report, call, level and tag
+                      query parameters, a page at a time
+
+Add format=json to the query string of either to get JSON instead of HTML.
+"""
+
+import argparse
+import BaseHTTPServer
+import cgi
+import json
+import logging
+import os
+import SocketServer
+import threading
+import time
+import urllib
+import urlparse
+
+from event import Event
+from index import Index, add_index_args
+
+
+# Events per page, by default and at most
+PAGE_SIZE = 100
+MAX_PAGE_SIZE = 500
+
+STYLE = """
+body { font-family: sans-serif; font-size: small; color: #333; margin: 20px; }
+a { color: #2980b9; text-decoration: none; }
+table { border-collapse: collapse; width: 100%; }
+th, td { padding: 5px 7px; text-align: left; vertical-align: top; }
+tr:nth-child(even) { background: #f5f5f5; }
+form { margin: 10px 0; }
+code, .shy { color: #aaa; }
+.harmless { color: #27ae60; }
+.interesting { color: #2980b9; }
+.suspicious { color: #f39c12; }
+.risky { color: #d35400; }
+.bad { color: #c0392b; }
+"""
+
+
+class Handler(BaseHTTPServer.BaseHTTPRequestHandler):
+    """Answers a single request."""
+
+    server_version = "iodog/0.1"
+
+    def do_GET(self):
+        url = urlparse.urlparse(self.path)
+        params = dict((k, v[-1]) for (k, v) in
+                      urlparse.parse_qs(url.query).items())
+        as_json = params.pop("format", None) == "json"
+
+        pages = {"/": self.reports_page, "/events": self.events_page}
+        if url.path not in pages:
+            self.send_error(404)
+            return
+
+        index = Index(self.server.db)
+        try:
+            (data, html) = pages[url.path](index, params)
+        except ValueError as e:
+            self.send_error(400, str(e))
+            return
+        finally:
+            index.close()
+
+        if as_json:
+            self.respond("application/json", json.dumps(data))
+        else:
+            self.respond("text/html; charset=utf-8", html)
+
+    def respond(self, content_type, body):
+        if isinstance(body, unicode):
+            body = body.encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def address_string(self):
+        # Don't look up the host name for every request
+        return self.client_address[0]
+
+    def log_message(self, format, *args):
+        logging.debug("%s %s" % (self.address_string(), format % args))
+
+    def reports_page(self, index, params):
+        """Shows a page of the indexed reports."""
+        limit = min(_int(params.get("limit"), "limit") or PAGE_SIZE,
+                    MAX_PAGE_SIZE)
+        rows = index.report_page(_int(params.get("after"), "after"),
+                                 limit + 1)
+        more = len(rows) > limit
+        reports = [dict(id=rid, path=os.path.basename(path),
+                        complete=bool(complete), created=created, file=file,
+                        user=user, process=process, events=events or 0)
+                   for (rid, path, complete, created, file, user, process,
+                        events) in rows[:limit]]
+
+        cursor = None
+        nav = u""
+        if more:
+            cursor = reports[-1]["id"]
+            query = dict((k, v) for (k, v) in params.items() if v)
+            query["after"] = cursor
+            nav = u"<p><a href=\"/?%s\">Next page</a></p>" % \
+                _e(urllib.urlencode(query))
+
+        rows = []
+        for r in reports:
+            rows.append(u"<tr><td><a href=\"/events?report=%d\">%s</a>%s</td>"
+                        u"<td>%s</td><td>%s</td><td>%s</td><td>%s</td>"
+                        u"<td>%d</td></tr>" % (
+                            r["id"], _e(r["path"]),
+                            u"" if r["complete"] else
+                            u" <span class=\"shy\">(incomplete)</span>",
+                            _e(r["created"]), _e(r["file"]), _e(r["user"]),
+                            _e(r["process"]), r["events"]))
+
+        html = _page(u"iodog reports", u"%s<table><tr><th>Report</th>"
+                     u"<th>Created</th><th>File</th><th>User</th>"
+                     u"<th>Process</th><th>Events</th></tr>%s</table>%s" % (
+                         _filter_form(dict()), u"".join(rows), nav))
+        return (dict(reports=reports, next=cursor), html)
+
+    def events_page(self, index, params):
+        """Shows a page of events."""
+        report = _int(params.get("report"), "report")
+        limit = min(_int(params.get("limit"), "limit") or PAGE_SIZE,
+                    MAX_PAGE_SIZE)
+
+        level = params.get("level") or None
+        if level is not None:
+            if level not in Event.LEVELS:
+                raise ValueError("unknown level '%s'" % level)
+            level = Event.LEVELS.index(level)
+
+        after = params.get("after") or None
+        if after is not None:
+            try:
+                after = tuple(int(n) for n in after.split("."))
+                (_, _) = after
+            except ValueError:
+                raise ValueError("bad position '%s'" % params["after"])
+
+        rows = index.page(report=report, call=params.get("call") or None,
+                          level=level, tag=params.get("tag") or None,
+                          after=after, limit=limit + 1)
+        more = len(rows) > limit
+        rows = rows[:limit]
+        frames = index.frames([row[7] for row in rows])
+
+        events = [dict(report=rid, seq=seq, t=t, call=call,
+                       level=Event.LEVELS[lvl], tags=tags, args=args,
+                       frames=frames.get(stack, []))
+                  for (rid, seq, t, call, lvl, tags, args, stack) in rows]
+
+        cursor = None
+        if more:
+            cursor = "%d.%d" % rows[-1][:2]
+
+        data = dict(events=events, next=cursor)
+
+        title = u"iodog events"
+        if report is not None:
+            info = index.report(report)
+            if info is None:
+                raise ValueError("no report %d" % report)
+            data["report"] = dict(zip(("path", "complete", "created", "file",
+                                       "user", "process"), info))
+            data["report"]["path"] = os.path.basename(info[0])
+            title = u"iodog report: %s" % _e(info[3])
+
+        rows = []
+        for ev in events:
+            stack = u"<br>".join(u"%s <code>%s:%d</code>" % (
+                _e(where), _e(filename), lineno)
+                for (where, filename, lineno) in ev["frames"])
+            rows.append(u"<tr><td>%s</td><td class=\"%s\">%s</td>"
+                        u"<td>%s(%s)</td><td>%s</td><td>%s</td></tr>" % (
+                            _e(ev["t"]), ev["level"], ev["level"],
+                            _e(ev["call"]),
+                            u", ".join(u"'%s'" % _e(a) for a in ev["args"]),
+                            _e(u", ".join(ev["tags"])), stack))
+
+        nav = u"<p><a href=\"/\">All reports</a>"
+        if cursor is not None:
+            query = dict((k, v) for (k, v) in params.items() if v)
+            query["after"] = cursor
+            nav += u" &middot; <a href=\"/events?%s\">Next page</a>" % \
+                _e(urllib.urlencode(query))
+        nav += u"</p>"
+
+        html = _page(title, u"%s%s<table><tr><th>Time</th><th>Level</th>"
+                     u"<th>Call</th><th>Tags</th><th>Stack</th></tr>%s"
+                     u"</table>%s" % (nav, _filter_form(params),
+                                      u"".join(rows), nav))
+        return (data, html)
+
+
+class Server(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    """Serves every request on its own thread."""
+
+    daemon_threads = True
+
+    # Path of the index database
+    db = None
+
+
+def _e(s):
+    """Escapes a string for use in HTML."""
+    if s is None:
+        return u""
+    if not isinstance(s, unicode):
+        s = str(s).decode("utf-8", "replace")
+    return cgi.escape(s, quote=True)
+
+
+def _int(value, name):
+    """Parses an optional integer query parameter."""
+    if not value:
+        return None
+    try:
+        return int(value)
+    except ValueError:
+        raise ValueError("%s must be a number" % name)
+
+
+def _filter_form(params):
+    """Returns the form for filtering events."""
+    levels = u"".join(u"<option%s>%s</option>" % (
+        u" selected" if params.get("level") == level else u"", level)
+        for level in [""] + Event.LEVELS)
+    report = u""
+    if params.get("report"):
+        report = u"<input type=\"hidden\" name=\"report\" value=\"%s\">" % \
+            _e(params["report"])
+    return (u"<form action=\"/events\">%s"
+            u"Call <input name=\"call\" value=\"%s\"> "
+            u"Level at least <select name=\"level\">%s</select> "
+            u"Tag <input name=\"tag\" value=\"%s\"> "
+            u"<input type=\"submit\" value=\"Filter\"></form>" % (
+                report, _e(params.get("call")), levels,
+                _e(params.get("tag"))))
+
+
+def _page(title, body):
+    return (u"<!DOCTYPE html><html><head><meta charset=\"utf-8\">"
+            u"<title>%s</title><style>%s</style></head><body><h1>%s</h1>%s"
+            u"</body></html>" % (title, STYLE, title, body))
+
+
+def _keep_updated(db, directory, interval):
+    """Updates the index every interval seconds. Runs on its own thread."""
+    index = Index(db)
+    while True:
+        try:
+            count = index.update(directory)
+            if count:
+                logging.debug("Indexed %d report(s)" % count)
+        except Exception:
+            logging.exception("Could not update the index")
+        time.sleep(interval)
+
+
+def serve_command(argv):
+    """The 'iodog serve' command: serves the reports over HTTP."""
+    parser = argparse.ArgumentParser(
+        prog="iodog serve",
+        description="Browse iodog reports in a web browser. Reports are "
+                    "indexed as they appear; see 'iodog index'.")
+    add_index_args(parser)
+    parser.add_argument("--host", default="127.0.0.1",
+                        help="address to listen on (default: 127.0.0.1)")
+    parser.add_argument("--port", type=int, default=8000,
+                        help="port to listen on (default: 8000)")
+    parser.add_argument("--interval", type=float, default=10,
+                        help="seconds between looking for new reports "
+                             "(default: 10)")
+    args = parser.parse_args(argv)
+
+    db = args.db or os.path.join(args.dir, "iodog.db")
+
+    # Let the updater write while pages are being read
+    index = Index(db)
+    index.db.execute("PRAGMA journal_mode = WAL")
+    index.update(args.dir)
+    index.close()
+
+    updater = threading.Thread(target=_keep_updated, name="index-updater",
+                               args=(db, args.dir, args.interval))
+    updater.daemon = True
+    updater.start()
+
+    server = Server((args.host, args.port), Handler)
+    server.db = db
+    logging.info("Serving http://%s:%d/" % (args.host, args.port))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
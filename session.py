@@ -0,0 +1,486 @@
+# -*- coding: utf-8 -*-
+
+"""
+Contains the Session class.
+"""
+
+import datetime
+import hashlib
+import logging
+import os
+import threading
+import time
+
+import dbgp
+from event import Event, EventSerializer
+from eventlog import EventLogEncoder
+import metrics
+import procinfo
+from transcript import TranscriptRecorder
+from utils import t
+import rules
+from rules.registry import Registry
+
+
+class Session(object):
+    """
+    A single debugger session, i.e. one PHP request being watched.
+
+    Everything that belongs to one request (the debugger connection, the
+    rulesets and the report file) lives here, so that several sessions can
+    run side by side without stepping on each other.
+    """
+
+    # The Iodog instance that accepted this session
+    # @type Iodog
+    iodog = None
+
+    # Our connection to the debugger
+    # @type dbgp.Api
+    api = None
+
+    # All active rulesets
+    # @type list[Ruleset]
+    rulesets = []
+
+    # Maps breakpoints to the rulesets that own them
+    # @type Registry
+    registry = None
+
+    # Timings and counts for this session
+    # @type metrics.Metrics
+    metrics = None
+
+    # The report being written
+    # @type report.Report
+    report = None
+
+    # The binary event log being written, if any
+    # @type report.Report
+    binlog = None
+
+    # Records the session's debugger traffic, if enabled
+    # @type TranscriptRecorder
+    recorder = None
+
+    # Turns events into report XML
+    # @type EventSerializer
+    serializer = None
+
+    # Encodes events for the binary event log
+    # @type EventLogEncoder
+    encoder = None
+
+    # Whether the report's header is written, so that events can follow
+    header_written = False
+
+    # Distinct stacks seen so far, by id, when they go in a stack table
+    # @type dict[str, str]
+    stacks = None
+
+    # Number of events per (call, call site)
+    # @type dict[tuple, int]
+    hits = None
+
+    # Number of events per call
+    # @type dict[str, int]
+    seen = None
+
+    # Breakpoints that were disarmed: id -> (call, call site, hit count
+    # still known)
+    # @type dict[int, tuple]
+    disarmed = None
+
+    # Breakpoints that the debugger would neither update nor remove
+    # @type set[int]
+    undisarmable = None
+
+    # Hit counts for the disarmed breakpoints, read at the end of the session
+    # @type dict[int, int]
+    hit_counts = None
+
+    # Current values of the debugger features that limit fetched arguments
+    # @type dict[str, int]
+    features = None
+
+    # Breaks handed to submit() and events written, so far
+    submitted = 0
+    written = 0
+
+    # Analyzed events waiting for their turn to be written, by number
+    # @type dict[int, Event]
+    done = None
+
+    # Guards done and written; notified when events are written
+    # @type threading.Condition
+    analyzed = None
+
+    # A disarmed breakpoint only breaks once it has been hit this often
+    NEVER = 2 ** 31 - 1
+
+    def __init__(self, iodog, connection):
+        """
+        @param iodog: The Iodog instance that accepted the connection.
+        @param connection: A connected dbgp.Connection.
+        """
+        self.iodog = iodog
+        self.metrics = metrics.Metrics(parent=metrics.REGISTRY)
+        self.metrics.inc('iodog_sessions_total')
+        if iodog.transcripts:
+            self.recorder = connection.recorder = TranscriptRecorder()
+        self.api = dbgp.Api(connection, self.metrics)
+        self.rulesets = rules.get_rulesets(self)
+        self.registry = Registry(self.rulesets, self.metrics)
+        self.hits = dict()
+        self.seen = dict()
+        self.disarmed = dict()
+        self.undisarmable = set()
+        self.hit_counts = dict()
+        self.features = dict()
+        self.serializer = EventSerializer()
+        self.done = dict()
+        self.analyzed = threading.Condition()
+
+    def investigate(self):
+        """
+        Called when a breakpoint is reached. Fetches what the break is to be
+        analyzed with, but leaves the responses unparsed, so that the script
+        can be resumed as soon as possible.
+
+        Returns a (t, stack, arg_eval, call, site) tuple for analyze();
+        arg_eval is None when no ruleset needs the arguments.
+        """
+        dt = self.now()
+        arg_eval = None
+
+        stack = self.api.stack_get()
+        top = stack.get_top()
+        call = top.get('where')
+        site = "%s:%s" % (top.get('filename'), top.get('lineno'))
+
+        if self.registry.wants_args(call):
+            arg_eval = self.api.eval("func_get_args()")
+
+        return (dt, stack, arg_eval, call, site)
+
+    def analyze(self, capture):
+        """
+        Turns what investigate() captured into an annotated Event. This only
+        looks at the captured responses, never at the debugger, so it may
+        run on any thread.
+
+        @param capture: The tuple returned by investigate().
+        """
+        (dt, stack, arg_eval, call, site) = capture
+        args = []
+        truncated = frozenset()
+        args_truncated = False
+
+        if arg_eval is not None:
+            properties = arg_eval.get_properties()
+            if properties:
+                children = properties[0].children
+                args = [child.value for child in children]
+                truncated = frozenset(i for (i, child) in enumerate(children)
+                                      if child.is_truncated())
+                args_truncated = properties[0].is_truncated()
+
+        ev = Event(t=dt, call=call, stack=stack.get_stack_xml(), args=args,
+                   site=site, truncated=truncated,
+                   args_truncated=args_truncated)
+        self.registry.annotate(ev)
+        return ev
+
+    def submit(self, capture):
+        """
+        Has a captured break analyzed and written, on the analysis pool if
+        there is one, or right away if not.
+
+        @param capture: The tuple returned by investigate().
+        """
+        seq = self.submitted
+        self.submitted += 1
+
+        if self.iodog.analysis is None:
+            self.finish(seq, capture)
+        else:
+            self.iodog.analysis.submit(self.finish, seq, capture)
+
+    def finish(self, seq, capture):
+        """
+        Analyzes a captured break, then writes every event that is next in
+        line. Events are written in the order their breaks happened in, no
+        matter in which order they are analyzed.
+
+        @param seq: The number of the break within the session.
+        @param capture: The tuple returned by investigate().
+        """
+        try:
+            ev = self.analyze(capture)
+        except Exception:
+            logging.exception("Could not analyze a call to %s" % capture[3])
+            ev = None
+
+        with self.analyzed:
+            try:
+                self.done[seq] = ev
+                while self.written in self.done:
+                    ev = self.done.pop(self.written)
+                    self.written += 1
+                    if ev is None:
+                        continue
+                    try:
+                        self.write_event(ev)
+                    except Exception:
+                        logging.exception("Could not write a call to %s"
+                                          % ev.call)
+            finally:
+                self.analyzed.notify_all()
+
+    def wait_analyzed(self):
+        """Waits until every submitted break has been written."""
+        with self.analyzed:
+            while self.written < self.submitted:
+                self.analyzed.wait()
+
+    def set_features(self, features):
+        """
+        Sets debugger features, skipping those that already have the right
+        value.
+
+        @param features: dict of feature name -> value
+        """
+        changes = dict((name, value) for (name, value) in features.items()
+                       if self.features.get(name) != value)
+        if not changes:
+            return
+
+        try:
+            responses = self.api.feature_set_many(changes)
+            for (name, res) in zip(sorted(changes), responses):
+                if res.get_attr('success') != '1':
+                    logging.debug("Debugger won't set %s" % name)
+        except (dbgp.DBGPError, dbgp.CmdNotImplementedError):
+            logging.debug("Debugger can't set %s" % ", ".join(changes))
+
+        # Don't try again, even if it failed
+        self.features.update(changes)
+
+    def count_hit(self, call, site):
+        """
+        Counts an event towards the hot call site limit, and disarms the
+        breakpoint behind it once any one call site has reached the limit.
+
+        The debugger can only disarm a breakpoint as a whole, so this stops
+        events for the function everywhere, not just at the hot call site.
+
+        @param call: The called function.
+        @param site: Where it was called, as 'file:line'.
+        """
+        self.seen[call] = self.seen.get(call, 0) + 1
+
+        key = (call, site)
+        count = self.hits[key] = self.hits.get(key, 0) + 1
+        if count < self.iodog.disarm_after:
+            return
+
+        bp = self.registry.ids.get(call)
+        if bp is None or bp in self.disarmed or bp in self.undisarmable:
+            return
+
+        logging.debug("Disarming %s, hit %d times at %s"
+                      % (call, count, site))
+        try:
+            # Keep the breakpoint, so that the debugger keeps counting
+            # hits, but make it never break again.
+            self.api.breakpoint_update(bp, hit_value=self.NEVER,
+                                       hit_condition='>=')
+            self.disarmed[bp] = (call, site, True)
+        except (dbgp.DBGPError, dbgp.CmdNotImplementedError):
+            try:
+                self.api.breakpoint_remove(bp)
+                self.disarmed[bp] = (call, site, False)
+            except (dbgp.DBGPError, dbgp.CmdNotImplementedError):
+                logging.debug("Debugger won't disarm %s" % call)
+                self.undisarmable.add(bp)
+
+    def count_suppressed(self):
+        """Reads the hit counts of the disarmed breakpoints."""
+        for (bp, (call, site, counted)) in self.disarmed.items():
+            if not counted:
+                continue
+            try:
+                count = self.api.breakpoint_get(bp).get_hit_count()
+            except (dbgp.DBGPError, dbgp.CmdNotImplementedError):
+                continue
+            if count is not None:
+                self.hit_counts[bp] = count
+
+    def suppressed_xml(self):
+        """Returns the report's table of disarmed breakpoints."""
+        out = ['<suppressions>']
+        for (bp, (call, site, counted)) in sorted(self.disarmed.items()):
+            attrs = dict(call=call, site=site, events=str(self.seen[call]))
+            if bp in self.hit_counts:
+                suppressed = max(self.hit_counts[bp] - self.seen[call], 0)
+                attrs['suppressed'] = str(suppressed)
+            out.append(t('suppressed', **attrs))
+        out.append('</suppressions>')
+        return ''.join(out)
+
+    def stack_id(self, stack):
+        """
+        Returns the id of a stack in this session's stack table, adding it
+        to the table if it is new. Ids are derived from the stack itself.
+
+        @param stack: The stack, as XML.
+        """
+        sid = hashlib.sha1(stack).hexdigest()[:16]
+        if sid not in self.stacks:
+            self.stacks[sid] = stack
+        return sid
+
+    def write_event(self, ev):
+        if self.stacks is not None:
+            ev.stack_id = self.stack_id(ev.stack)
+        self.report.write_event(self.serializer.serialize(ev))
+        self.metrics.inc('iodog_events_total', Event.LEVELS[ev.level])
+        if self.binlog is not None:
+            self.binlog.write_event(self.encoder.event(ev))
+
+    def now(self):
+        """Returns the time events and reports are stamped with."""
+        return datetime.datetime.now()
+
+    def process_info(self):
+        """Returns the procinfo.ProcessInfo of the debugged process."""
+        return procinfo.lookup(self.api.appid)
+
+    def start_session(self):
+        """Called at the beginning of a session."""
+        logging.debug("Start")
+
+        proc = self.process_info()
+        created = self.now()
+        fnfmt = "iodog_%Y%m%d%H%M%S%f_%%s_%%s"
+        fntpl = created.strftime(fnfmt)
+        filename = os.path.join(self.iodog.directory,
+                                fntpl % (self.api.appid, proc.user))
+        self.report = self.iodog.writer.open(filename + ".xml",
+                                             self.iodog.durability,
+                                             self.iodog.compression)
+
+        logging.debug(" File: " + self.api.startfile)
+        logging.debug(" Proc: " + self.api.appid)
+        logging.debug(" User: " + proc.user)
+        logging.debug(" Dest: " + self.report.file.name)
+
+        if self.iodog.stack_table:
+            self.stacks = dict()
+
+        if self.recorder is not None:
+            started = None
+            if proc.started is not None:
+                started = time.mktime(proc.started.timetuple()) + \
+                    proc.started.microsecond / 1e6
+            self.recorder.attach(
+                self.iodog.writer.open(filename + ".dbgp",
+                                       self.iodog.durability, 'gzip'),
+                dict(user=proc.user, uid=proc.uid, cmdline=proc.cmdline,
+                     cwd=proc.cwd, started=started))
+
+        if self.iodog.binlog:
+            self.binlog = self.iodog.writer.open(filename + ".iel",
+                                                 self.iodog.durability,
+                                                 binary=True)
+            self.encoder = EventLogEncoder()
+            self.binlog.write(self.encoder.header(
+                created, self.api.startfile, proc.user, self.api.appid,
+                self.rulesets))
+
+        out = list()
+        out.append('<?xml version="1.0"?>')
+        out.append('<?xml-stylesheet type="text/xsl" href="style-0.1.xsl"?>')
+        out.append('<report>')
+        out.append(t('generator', 'iodog v0.1'))
+        out.append(t('created', created.isoformat()))
+        out.append(t('file', self.api.startfile))
+        out.append(t('user', proc.user))
+        out.append(t('process', self.api.appid))
+        if proc.uid is not None:
+            out.append(t('uid', proc.uid))
+        if proc.cmdline is not None:
+            out.append(t('cmdline', proc.cmdline))
+        if proc.cwd is not None:
+            out.append(t('cwd', proc.cwd))
+        if proc.started is not None:
+            out.append(t('started', proc.started.isoformat()))
+
+        out.append('<rulesets>')
+        for ruleset in self.rulesets:
+            out.append(t('ruleset', ruleset))
+        out.append('</rulesets>')
+
+        self.registry.register(self.api)
+        features = self.registry.negotiate(self.iodog.limits)
+        # Only the top level of each argument ends up in the report
+        features['max_depth'] = 1
+        self.set_features(features)
+
+        out.append('<events>')
+        self.report.write(''.join(out))
+        self.header_written = True
+
+    def end_session(self):
+        """Called at the end of a session."""
+        logging.debug("End")
+        self.wait_analyzed()
+        if self.header_written:
+            out = ['</events>']
+            out.append(self.metrics.to_xml())
+            if self.disarmed:
+                out.append(self.suppressed_xml())
+            if self.stacks is not None:
+                out.append('<stacks>')
+                for (sid, stack) in sorted(self.stacks.items()):
+                    out.append('<frames id="%s">%s</frames>' % (sid, stack))
+                out.append('</stacks>')
+            out.append('</report>')
+            self.report.write(''.join(out))
+
+        # The session may have failed before everything was opened
+        if self.report is not None:
+            self.report.close()
+        if self.binlog is not None:
+            self.binlog.close()
+        if self.recorder is not None:
+            self.recorder.close()
+
+    def run(self):
+        """Runs the session until the debugger detaches."""
+        logging.debug("Starting session")
+
+        try:
+            self.start_session()
+
+            # After this, run() tells us the status
+            status = self.api.status()
+
+            while True:
+                if status.is_stopping():
+                    logging.debug("(-> %s) detaching" % status)
+                    self.count_suppressed()
+                    break
+                elif status.is_break():
+                    capture = self.investigate()
+                    if self.iodog.disarm_after:
+                        self.count_hit(capture[3], capture[4])
+                    self.submit(capture)
+                    status = self.api.run()
+                else:
+                    logging.debug("(-> %s)" % status)
+                    status = self.api.run()
+
+            self.api.detach()
+        finally:
+            self.end_session()
@@ -29,6 +29,10 @@
   -->
   <xsl:variable name="xslversion" select="'0.1'" />
 
+  <!-- Reports written with a stack table keep each distinct stack once, in
+       /report/stacks, and have their events refer to it by id. -->
+  <xsl:key name="stacks" match="/report/stacks/frames" use="@id" />
+
   <xsl:template match="/report">
     <html>
       <head>
@@ -452,6 +456,20 @@
                   </xsl:if>
                 </td>
               </tr>
+              <xsl:if test="cmdline or cwd">
+                <tr>
+                  <th>Command</th>
+                  <td>
+                    <code><xsl:value-of select="cmdline" /></code>
+                    <xsl:if test="started">
+                      <xsl:text> </xsl:text>
+                      <span class="shy">(since <xsl:value-of select="translate(started, 'T', ' ')" />)</span>
+                    </xsl:if>
+                  </td>
+                  <th>Directory</th>
+                  <td><xsl:value-of select="cwd" /></td>
+                </tr>
+              </xsl:if>
               <tr>
                 <th>Rulesets</th>
                 <td colspan="3">
@@ -475,6 +493,44 @@
                   <strong class="bad"><xsl:value-of select="count(events/event[level='bad'])" /></strong> bad
                 </td>
               </tr>
+              <xsl:if test="metrics/timing[@kind='command']">
+                <tr>
+                  <th>Debugger</th>
+                  <td colspan="3">
+                    <xsl:for-each select="metrics/timing[@kind='command']">
+                      <xsl:value-of select="@name" />
+                      <xsl:text> </xsl:text>
+                      <strong><xsl:value-of select="@count" /></strong>
+                      <span class="shy">
+                        <xsl:text>×</xsl:text>
+                        <xsl:value-of select="format-number(@total div @count * 1000, '0.000')" />
+                        <xsl:text> ms</xsl:text>
+                      </span>
+                      <xsl:if test="position() != last()">, </xsl:if>
+                    </xsl:for-each>
+                  </td>
+                </tr>
+              </xsl:if>
+              <xsl:if test="suppressions/suppressed">
+                <tr>
+                  <th>Suppressed</th>
+                  <td colspan="3">
+                    <xsl:for-each select="suppressions/suppressed">
+                      <strong><xsl:value-of select="@call" /></strong>
+                      <xsl:text> after </xsl:text>
+                      <xsl:value-of select="@events" />
+                      <xsl:text> events</xsl:text>
+                      <xsl:if test="@suppressed">
+                        <xsl:text>, </xsl:text>
+                        <strong><xsl:value-of select="@suppressed" /></strong>
+                        <xsl:text> more calls not recorded</xsl:text>
+                      </xsl:if>
+                      <span class="shy"> (hot at <xsl:value-of select="@site" />)</span>
+                      <br />
+                    </xsl:for-each>
+                  </td>
+                </tr>
+              </xsl:if>
             </table>
           </div>
 
@@ -518,12 +574,13 @@
 
       "args": [
         <xsl:for-each select="args/arg">
-        "<xsl:value-of select="normalize-space(.)" />",
+        "<xsl:value-of select="normalize-space(.)" /><xsl:if test="@truncated">…</xsl:if>",
         </xsl:for-each>
+        <xsl:if test="args/@truncated">"…",</xsl:if>
       ],
 
       "frames": [
-        <xsl:for-each select="frames/stack">
+        <xsl:for-each select="frames/stack | key('stacks', frames/@ref)/stack">
           {
           "type": "<xsl:value-of select="@type" />",
           "filename": "<xsl:value-of select="@filename" />",
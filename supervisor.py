@@ -0,0 +1,249 @@
+# -*- coding: utf-8 -*-
+
+"""
+Contains the Supervisor class, which runs iodog in several worker processes
+so that the analysis isn't limited to the one core the interpreter lock
+allows a single process.
+
+Every worker listens on the same port with SO_REUSEPORT, and the kernel
+spreads the debugger connections across them. The supervisor restarts
+workers that die, and adds up the metrics that the workers send it.
+
+Workers that keep dying right after they start (say, because something else
+has the port) are restarted with a growing delay, and after FAILURES such
+deaths in a row the supervisor gives up.
+"""
+
+import logging
+import multiprocessing
+import os
+import signal
+import threading
+import time
+
+import metrics
+
+
+def _interrupt(signum, frame):
+    raise KeyboardInterrupt()
+
+
+class Worker(object):
+    """One worker process, as seen by the supervisor."""
+
+    # @type multiprocessing.Process
+    process = None
+
+    # The supervisor's end of the pipe the worker sends metrics over
+    conn = None
+
+    # The worker's most recent Metrics.snapshot(), if any
+    # @type dict
+    snapshot = None
+
+    # When the worker was started
+    started = None
+
+    def __init__(self, number, factory, interval):
+        """
+        Starts a worker process.
+
+        @param number: The worker's number, for its name.
+        @param factory: Creates the worker's Iodog instance.
+        @param interval: Seconds between the worker's metrics updates.
+        """
+        self.started = time.time()
+        (self.conn, child) = multiprocessing.Pipe(duplex=False)
+        self.process = multiprocessing.Process(
+            target=self.run, args=(factory, child, interval),
+            name="worker-%d" % number)
+        self.process.daemon = True
+        self.process.start()
+        child.close()
+
+    def run(self, factory, conn, interval):
+        """Runs iodog in the worker process."""
+        # Only the supervisor decides when workers stop
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+        signal.signal(signal.SIGTERM, _interrupt)
+
+        lock = threading.Lock()
+
+        def send():
+            with lock:
+                conn.send(metrics.REGISTRY.snapshot())
+
+        def keep_sending():
+            while True:
+                time.sleep(interval)
+                send()
+
+        iodog = factory()
+        sender = threading.Thread(target=keep_sending, name="metrics-sender")
+        sender.daemon = True
+        sender.start()
+        try:
+            iodog.main()
+        finally:
+            send()
+
+    def receive(self):
+        """Takes in the metrics that the worker has sent."""
+        try:
+            while self.conn.poll():
+                self.snapshot = self.conn.recv()
+        except (EOFError, IOError):
+            pass
+
+
+class Supervisor(object):
+    """Starts, watches and stops the worker processes."""
+
+    # @type list[Worker]
+    workers = None
+
+    # Metrics of the workers that have exited
+    # @type metrics.Metrics
+    retired = None
+
+    # Serves the added up metrics, if enabled
+    # @type BaseHTTPServer.HTTPServer
+    metrics_server = None
+
+    # Worker number -> deaths right after starting, in a row
+    # @type dict[int, int]
+    failures = None
+
+    # Worker number -> when to start a replacement for the dead worker
+    # @type dict[int, float]
+    restarts = None
+
+    # Whether the supervisor gave up on a worker
+    failed = False
+
+    # A worker that dies within this many seconds failed to start
+    STARTUP = 5
+
+    # Give up after this many failed starts in a row
+    FAILURES = 5
+
+    # The longest delay before restarting a worker, in seconds
+    MAX_DELAY = 60
+
+    def __init__(self, factory, processes, metrics_port=None, interval=5):
+        """
+        @param factory: Creates an Iodog instance; called in each worker.
+                        The instances must listen with reuse_port.
+        @param processes: The number of workers.
+        @param metrics_port: Port to serve the workers' metrics on, or None.
+        @param interval: Seconds between the workers' metrics updates.
+        """
+        self.factory = factory
+        self.processes = processes
+        self.metrics_port = metrics_port
+        self.interval = interval
+        self.retired = metrics.Metrics()
+        self.failures = dict()
+        self.restarts = dict()
+
+    def start_worker(self, number):
+        worker = Worker(number, self.factory, self.interval)
+        logging.info("Started worker %d (pid %d)"
+                     % (number, worker.process.pid))
+        return worker
+
+    def total(self):
+        """Returns the metrics of all workers, current and past, added up."""
+        total = metrics.Metrics()
+        total.merge(self.retired.snapshot())
+        for worker in self.workers:
+            if worker.snapshot is not None:
+                total.merge(worker.snapshot)
+        return total
+
+    def check(self):
+        """
+        Collects metrics, and replaces workers that have died. Returns False
+        once a worker has failed to start too often.
+        """
+        now = time.time()
+        for (number, worker) in enumerate(self.workers):
+            if number in self.restarts:
+                if now >= self.restarts[number]:
+                    del self.restarts[number]
+                    self.workers[number] = self.start_worker(number)
+                continue
+
+            worker.receive()
+            if worker.process.is_alive():
+                continue
+
+            worker.process.join()
+            worker.receive()
+            if worker.snapshot is not None:
+                self.retired.merge(worker.snapshot)
+                worker.snapshot = None
+
+            if now - worker.started < self.STARTUP:
+                failures = self.failures[number] = \
+                    self.failures.get(number, 0) + 1
+            else:
+                failures = self.failures[number] = 0
+
+            if failures >= self.FAILURES:
+                logging.error("Worker %d (pid %d) exited with %s; it failed "
+                              "to start %d times in a row, giving up"
+                              % (number, worker.process.pid,
+                                 worker.process.exitcode, failures))
+                return False
+
+            delay = min(2 ** failures - 1, self.MAX_DELAY)
+            logging.warning("Worker %d (pid %d) exited with %s, restarting "
+                            "in %d s" % (number, worker.process.pid,
+                                         worker.process.exitcode, delay))
+            self.restarts[number] = now + delay
+
+        if self.metrics_server is not None:
+            self.metrics_server.metrics = self.total()
+        return True
+
+    def stop(self):
+        """Stops the workers and waits for them to finish their reports."""
+        for worker in self.workers:
+            if worker.process.is_alive():
+                os.kill(worker.process.pid, signal.SIGTERM)
+        for worker in self.workers:
+            while worker.process.is_alive():
+                worker.receive()
+                worker.process.join(0.1)
+            worker.receive()
+
+    def main(self):
+        """
+        Runs the workers until interrupted. Returns the exit status: 0, or 1
+        if the supervisor gave up on a worker.
+        """
+        signal.signal(signal.SIGTERM, _interrupt)
+        self.workers = []
+        try:
+            for number in range(self.processes):
+                self.workers.append(self.start_worker(number))
+            if self.metrics_port:
+                self.metrics_server = metrics.serve(self.metrics_port,
+                                                    metrics=self.total())
+
+            while self.check():
+                time.sleep(1)
+            self.failed = True
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.stop()
+
+        total = self.total()
+        events = sum(n for ((family, label), n) in total.counters.items()
+                     if family == 'iodog_events_total')
+        logging.info("%d sessions, %d events"
+                     % (total.counters.get(('iodog_sessions_total', None), 0),
+                        events))
+        return 1 if self.failed else 0
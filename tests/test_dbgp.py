@@ -0,0 +1,75 @@
+# -*- coding: utf-8 -*-
+
+"""
+Tests for the message framing in dbgp.py. Run from the top directory:
+
+    python2 -m unittest discover tests
+"""
+
+import unittest
+
+import dbgp
+
+
+def frame(body):
+    return b'%d\0%s\0' % (len(body), body)
+
+
+class FakeSocket(object):
+    """Hands out the given chunks, one per recv_into call."""
+
+    def __init__(self, chunks):
+        self.chunks = list(chunks)
+
+    def recv_into(self, view):
+        if not self.chunks:
+            return 0
+        chunk = self.chunks.pop(0)
+        n = min(len(chunk), len(view))
+        view[:n] = chunk[:n]
+        if n < len(chunk):
+            self.chunks.insert(0, chunk[n:])
+        return n
+
+    def close(self):
+        pass
+
+
+class ConnectionTest(unittest.TestCase):
+
+    def connect(self, *chunks):
+        return dbgp.Connection(sock=FakeSocket(chunks), address=('test', 0))
+
+    def test_message_split_across_receives(self):
+        data = frame(b'<init appid="1"/>')
+        conn = self.connect(data[:1], data[1:3], data[3:-1], data[-1:])
+        self.assertEqual(conn.recv_msg(), b'<init appid="1"/>')
+
+    def test_several_messages_per_receive(self):
+        last = frame(b'<c/>')
+        conn = self.connect(frame(b'<a/>') + frame(b'<b/>') + last[:4],
+                            last[4:])
+        self.assertEqual(conn.recv_msg(), b'<a/>')
+        self.assertEqual(conn.recv_msg(), b'<b/>')
+        self.assertEqual(conn.recv_msg(), b'<c/>')
+        self.assertRaises(EOFError, conn.recv_msg)
+
+    def test_message_larger_than_buffer(self):
+        body = b'<x>%s</x>' % (b'a' * (3 * dbgp.Connection.RECV_SIZE))
+        data = frame(body) + frame(b'<y/>')
+        conn = self.connect(*[data[i:i + 5000]
+                              for i in range(0, len(data), 5000)])
+        self.assertEqual(conn.recv_msg(), body)
+        self.assertEqual(conn.recv_msg(), b'<y/>')
+
+    def test_invalid_length(self):
+        conn = self.connect(b'12x\0<a/>\0')
+        self.assertRaises(dbgp.ResponseError, conn.recv_msg)
+
+    def test_missing_terminator(self):
+        conn = self.connect(b'4\0<a/>X')
+        self.assertRaises(dbgp.ResponseError, conn.recv_msg)
+
+
+if __name__ == '__main__':
+    unittest.main()
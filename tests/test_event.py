@@ -0,0 +1,51 @@
+# -*- coding: utf-8 -*-
+
+"""
+Tests for event.py. Run from the top directory:
+
+    python2 -m unittest discover tests
+"""
+
+import datetime
+import unittest
+import xml.etree.ElementTree as ElementTree
+
+import dbgp
+from event import Event, EventSerializer
+
+
+EMPTY_STACK = ('<?xml version="1.0" encoding="iso-8859-1"?>\n'
+               '<response xmlns="urn:debugger_protocol_v1" '
+               'command="stack_get" transaction_id="3"></response>')
+
+
+class EventSerializerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.serializer = EventSerializer()
+        self.t = datetime.datetime(2014, 3, 15, 20, 16, 14, 644226)
+
+    def test_empty_stack(self):
+        stack = dbgp.StackGetResponse(EMPTY_STACK, 'stack_get', '', None)
+        top = stack.get_top()
+        self.assertEqual(top, dict())
+
+        ev = Event(t=self.t, call=top.get('where'),
+                   stack=stack.get_stack_xml(), args=[])
+        xml = ElementTree.fromstring(self.serializer.serialize(ev))
+        self.assertEqual(xml.get('call'), '')
+        self.assertEqual(xml.findtext('level'), Event.LEVELS[0])
+
+    def test_recovers_from_failed_event(self):
+        bad = Event(t=None, call='fopen')
+        self.assertRaises(AttributeError, self.serializer.serialize, bad)
+
+        ev = Event(t=self.t, call='fopen', args=[u'/etc/p\xe4sswd', 3])
+        xml = ElementTree.fromstring(self.serializer.serialize(ev))
+        self.assertEqual(xml.get('call'), 'fopen')
+        self.assertEqual([arg.text for arg in xml.findall('args/arg')],
+                         [u'/etc/p\xe4sswd', '3'])
+
+
+if __name__ == '__main__':
+    unittest.main()
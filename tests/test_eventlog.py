@@ -0,0 +1,90 @@
+# -*- coding: utf-8 -*-
+
+"""
+Tests for eventlog.py. Run from the top directory:
+
+    python2 -m unittest discover tests
+"""
+
+import datetime
+import os
+import shutil
+import tempfile
+import unittest
+
+from event import Event
+from eventlog import EventLog, EventLogEncoder
+
+
+STACK = ('<stack where="fopen" level="0" type="file" '
+         'filename="file:///srv/a&amp;b.php" lineno="3"/>'
+         '<stack where="{main}" level="1" type="file" '
+         'filename="file:///srv/index.php" lineno="12"/>')
+
+
+class EventLogTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.filename = os.path.join(self.directory, "test.iel")
+        self.created = datetime.datetime(2014, 3, 15, 20, 16, 14, 644226)
+
+        encoder = EventLogEncoder()
+        self.data = encoder.header(self.created, 'file:///srv/index.php',
+                                   'http', '10644', ['rules.fileio'])
+        self.events = [
+            Event(t=self.created, call='fopen', stack=STACK, level=3,
+                  tags=set(['io', 'write']), args=[u'/tmp/p\xe4th', 'w']),
+            Event(t=self.created + datetime.timedelta(seconds=1),
+                  call='fopen', stack=STACK, args=[]),
+        ]
+        self.ends = []
+        for ev in self.events:
+            self.data += encoder.event(ev)
+            self.ends.append(len(self.data))
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def read(self, data):
+        with open(self.filename, 'wb') as f:
+            f.write(data)
+        return EventLog(self.filename)
+
+    def test_round_trip(self):
+        log = self.read(self.data)
+        try:
+            self.assertEqual(log.created, self.created)
+            self.assertEqual((log.file, log.user, log.process),
+                             ('file:///srv/index.php', 'http', '10644'))
+            self.assertEqual(log.rulesets, ['rules.fileio'])
+
+            events = list(log)
+            self.assertEqual(len(events), 2)
+            for (got, ev) in zip(events, self.events):
+                self.assertEqual(got.t, ev.t)
+                self.assertEqual(got.level, ev.level)
+                self.assertEqual(got.call, ev.call)
+                self.assertEqual(got.tags, sorted(ev.tags))
+                self.assertEqual(got.frames,
+                                 [('fopen', 'file:///srv/a&b.php', 3),
+                                  ('{main}', 'file:///srv/index.php', 12)])
+            self.assertEqual(events[0].args,
+                             [u'/tmp/p\xe4th'.encode('utf-8'), 'w'])
+            self.assertEqual(events[1].args, [])
+        finally:
+            log.close()
+
+    def test_cut_short(self):
+        log = self.read(self.data[:self.ends[1] - 1])
+        try:
+            self.assertEqual([ev.call for ev in log], ['fopen'])
+        finally:
+            log.close()
+
+    def test_not_an_event_log(self):
+        self.assertRaises(ValueError, self.read, b'<report/>' * 4)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,124 @@
+# -*- coding: utf-8 -*-
+
+"""
+Tests for rules/registry.py. Run from the top directory:
+
+    python2 -m unittest discover tests
+"""
+
+import unittest
+
+from event import Event
+from rules.registry import Registry
+from rules.ruleset import Ruleset
+
+
+class FakeBreakpoint(object):
+
+    def __init__(self, id):
+        self.id = id
+
+    def get_id(self):
+        return self.id
+
+
+class FakeApi(object):
+    """Hands out breakpoint ids, and remembers what was asked for."""
+
+    def __init__(self):
+        self.batches = []
+
+    def breakpoint_set_calls(self, calls):
+        self.batches.append(list(calls))
+        return [FakeBreakpoint(100 + i) for i in range(len(calls))]
+
+
+class Recorder(Ruleset):
+    """Remembers the events it was asked to annotate."""
+
+    def __init__(self, triggers, args=(), limits=None):
+        Ruleset.__init__(self, None)
+        self.TRIGGERS = set(triggers)
+        self.ARGS = set(args)
+        self.LIMITS = limits or dict()
+        self.seen = []
+        self.args = None
+        self.registered = False
+
+    def register(self):
+        self.registered = True
+
+    def annotate(self, event):
+        self.seen.append(event.call)
+        self.args = event.args
+
+
+class RegistryTest(unittest.TestCase):
+
+    def setUp(self):
+        self.files = Recorder(['fopen', 'unlink'])
+        self.procs = Recorder(['exec', 'fopen'], args=['exec'])
+        self.registry = Registry([self.files, self.procs])
+        self.api = FakeApi()
+        self.registry.register(self.api)
+
+    def test_one_breakpoint_per_function(self):
+        self.assertEqual(self.api.batches, [['exec', 'fopen', 'unlink']])
+        self.assertEqual(self.registry.ids,
+                         {'exec': 100, 'fopen': 101, 'unlink': 102})
+        self.assertTrue(self.files.registered and self.procs.registered)
+
+    def test_dispatch_to_owners(self):
+        self.registry.annotate(Event(call='unlink'))
+        self.registry.annotate(Event(call='fopen'))
+        self.registry.annotate(Event(call='exec'))
+        self.assertEqual(self.files.seen, ['unlink', 'fopen'])
+        self.assertEqual(self.procs.seen, ['fopen', 'exec'])
+
+    def test_unknown_call_goes_to_all(self):
+        self.registry.annotate(Event(call='mail'))
+        self.assertEqual(self.files.seen, ['mail'])
+        self.assertEqual(self.procs.seen, ['mail'])
+
+    def test_wants_args(self):
+        self.assertTrue(self.registry.wants_args('exec'))
+        self.assertFalse(self.registry.wants_args('fopen'))
+        self.assertFalse(self.registry.wants_args('unlink'))
+
+
+class LimitsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.sql = Recorder(['mysql_query', 'exec'], args=['mysql_query'],
+                            limits=dict(max_data=8))
+        self.procs = Recorder(['exec'], args=['exec'])
+        self.registry = Registry([self.sql, self.procs])
+        self.defaults = dict(max_data=4, max_children=2)
+
+    def test_most_generous_limits_are_fetched(self):
+        self.assertEqual(self.registry.negotiate(self.defaults),
+                         dict(max_data=8, max_children=2))
+
+    def test_zero_means_no_limit(self):
+        self.procs.LIMITS = dict(max_children=0)
+        self.assertEqual(self.registry.negotiate(self.defaults),
+                         dict(max_data=8, max_children=0))
+
+    def test_args_kept_to_the_limits_of_who_wants_them(self):
+        self.registry.negotiate(self.defaults)
+
+        ev = Event(call='exec', args=['01234567', 'x'])
+        self.registry.annotate(ev)
+        self.assertEqual(self.sql.args, ['01234567', 'x'])
+        self.assertEqual(self.procs.args, ['0123', 'x'])
+        self.assertEqual(ev.args, ['0123', 'x'])
+        self.assertEqual(ev.truncated, frozenset([0]))
+
+        ev = Event(call='mysql_query', args=['01234567'])
+        self.registry.annotate(ev)
+        self.assertEqual(ev.args, ['01234567'])
+        self.assertEqual(ev.truncated, frozenset())
+
+
+if __name__ == '__main__':
+    unittest.main()
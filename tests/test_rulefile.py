@@ -0,0 +1,100 @@
+# -*- coding: utf-8 -*-
+
+"""
+Tests for rules/rulefile.py. Run from the top directory:
+
+    python2 -m unittest discover tests
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from event import Event
+from rules.rulefile import RuleFile, RuleSyntaxError
+
+
+class RuleFileTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def compile(self, text):
+        path = os.path.join(self.directory, "test.rules")
+        with open(path, "w") as f:
+            f.write(text)
+        return RuleFile(path)
+
+    def test_blocks(self):
+        rules = self.compile('# Comment\n'
+                             'risky +blacklist +exec:\n'
+                             '    exec passthru  # trailing comment\n'
+                             '\n'
+                             '    system, shell_exec\n'
+                             'interesting +io:\n'
+                             '    fopen exec\n')
+        self.assertEqual(rules.triggers,
+                         set(['exec', 'passthru', 'system', 'shell_exec',
+                              'fopen']))
+        self.assertEqual(rules.actions('system'),
+                         (Event.RISKY, set(['blacklist', 'exec']), ()))
+        (level, tags, conditional) = rules.actions('exec')
+        self.assertEqual(level, Event.RISKY)
+        self.assertEqual(tags, set(['blacklist', 'exec', 'io']))
+        self.assertIsNone(rules.actions('mail'))
+        self.assertEqual(rules.args, set())
+
+    def test_conditions(self):
+        rules = self.compile('suspicious +sql if arg0 !startswith "SELECT " '
+                             'and arg1 matches "^db[0-9]$":\n'
+                             '    mysql_query\n')
+        self.assertEqual(rules.args, set(['mysql_query']))
+        ((predicates, level, tags),) = rules.actions('mysql_query')[2]
+        self.assertEqual((level, tags), (Event.SUSPICIOUS, set(['sql'])))
+
+        def holds(*args):
+            return all(predicate(list(args)) for predicate in predicates)
+
+        self.assertTrue(holds('DROP TABLE x', 'db1'))
+        self.assertFalse(holds('SELECT 1', 'db1'))
+        self.assertFalse(holds('DROP TABLE x', 'db'))
+        # A missing argument never matches
+        self.assertFalse(holds('DROP TABLE x'))
+
+    def test_args_keyword(self):
+        rules = self.compile('interesting args:\n'
+                             '    mail\n')
+        self.assertEqual(rules.args, set(['mail']))
+        self.assertEqual(rules.actions('mail'),
+                         (Event.INTERESTING, set(), ()))
+
+    def test_errors(self):
+        for text in ['    fopen\n',
+                     'risky\n    fopen\n',
+                     'risky:\n',
+                     'fatal:\n    fopen\n',
+                     'risky if arg0 ==:\n    fopen\n',
+                     'risky if first == "x":\n    fopen\n',
+                     'risky if arg0 is "x":\n    fopen\n',
+                     'risky if arg0 matches "(":\n    fopen\n',
+                     'risky if arg0 == "x" or arg1 == "y":\n    fopen\n',
+                     'set max_depth 2\n',
+                     'set max_data lots\n']:
+            self.assertRaises(RuleSyntaxError, self.compile, text)
+
+    def test_block_followed_by_set(self):
+        rules = self.compile('suspicious if arg0 == "x":\n'
+                             '    fopen\n'
+                             'set max_data 8192\n')
+        (level, tags, conditional) = rules.actions('fopen')
+        self.assertEqual(len(conditional), 1)
+        self.assertEqual(conditional[0][1], Event.SUSPICIOUS)
+        self.assertEqual(rules.limits, {'max_data': 8192})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,109 @@
+# -*- coding: utf-8 -*-
+
+"""
+Contains the DBGp transcript format: the TranscriptRecorder that writes a
+session's raw debugger traffic, and read_transcript, which reads it back.
+
+A transcript starts with the MAGIC bytes, followed by records. Every record
+is a one-byte direction, a little-endian double timestamp (seconds since the
+epoch), a uint32 length and that many bytes of payload:
+
+    H  header: a JSON object with what is known about the debugged process
+    <  a message received from the debugger
+    >  a command sent to the debugger
+
+Transcripts are written gzip-compressed, as iodog_*.dbgp.gz next to the
+report. See replay.py for what they are good for.
+"""
+
+import json
+import struct
+import time
+
+from report import open_report
+
+
+MAGIC = b'IODOGTR\x01'
+
+RECORD = struct.Struct('<cdI')
+
+HEADER = b'H'
+RECEIVED = b'<'
+SENT = b'>'
+
+
+class TranscriptRecorder(object):
+    """
+    Records the messages passing through a dbgp.Connection. Messages are
+    kept in memory until the transcript file is known, see attach().
+    """
+
+    # The transcript being written, once attached
+    # @type report.Report
+    report = None
+
+    # Records that came in before attach()
+    # @type list[str]
+    pending = None
+
+    def __init__(self):
+        self.pending = []
+
+    def record(self, direction, payload):
+        """
+        Records a message.
+
+        @param direction: RECEIVED or SENT.
+        @param payload: The message, without its framing.
+        """
+        data = RECORD.pack(direction, time.time(), len(payload)) + payload
+        if self.report is None:
+            self.pending.append(data)
+        else:
+            self.report.write(data)
+
+    def attach(self, report, header):
+        """
+        Starts writing the transcript, beginning with the messages recorded
+        so far.
+
+        @param report: The report.Report to write to.
+        @param header: A dict describing the debugged process.
+        """
+        payload = json.dumps(header)
+        report.write(MAGIC + RECORD.pack(HEADER, time.time(), len(payload)) +
+                     payload + b''.join(self.pending))
+        self.pending = None
+        self.report = report
+
+    def close(self):
+        if self.report is not None:
+            self.report.close()
+
+
+def read_transcript(filename):
+    """
+    Yields the (direction, time, payload) records of a transcript. A
+    transcript that was cut short ends at its last complete record.
+
+    @param filename: The transcript to read; it may be compressed.
+    """
+    f = open_report(filename)
+    try:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError("%s is not an iodog transcript" % filename)
+
+        while True:
+            head = f.read(RECORD.size)
+            if len(head) < RECORD.size:
+                return
+            (direction, t, length) = RECORD.unpack(head)
+            payload = f.read(length)
+            if len(payload) < length:
+                return
+            yield (direction, t, payload)
+    except (IOError, EOFError):
+        # A compressed transcript that is still being written
+        return
+    finally:
+        f.close()